@@ -0,0 +1,134 @@
+# Capacity planning for oversubscribed / generalized Clos fabrics
+#
+# 对同一交换机端口数 k，按不同的 edge (H:A) 和 agg (E:C) 超额订阅比生成 Clos，
+# 用控制器相同的静态上行分流 (fat_tree_uplinks.route) 计算每个流量矩阵下的
+# max-min 公平吞吐 (所有链路容量 = 主机网卡速率 1)，输出交换机数与吞吐的取舍。
+#
+# Usage:
+#   python3 bench_clos_capacity.py --k 8 --edge-ratios 1 3 7 --agg-ratios 1 3
+#   python3 bench_clos_capacity.py --k 8 --uplinks fat_tree_uplinks.json
+import json
+
+from fat_tree_model import FatTreeModel
+from fat_tree_uplinks import UplinkTable, default_matrices, route
+
+
+def max_min_rates(paths, capacities=None):
+    """Max-min fair rates for flows over links (progressive filling).
+
+    Links have unit capacity unless listed in ``capacities``; a per-flow
+    link with the flow's demand as capacity caps demand-limited flows.
+    """
+    capacities = capacities or {}
+    rates = [0.0] * len(paths)
+    remaining = {}
+    users = {}
+    for f, links in enumerate(paths):
+        for link in links:
+            remaining[link] = capacities.get(link, 1.0)
+            users.setdefault(link, set()).add(f)
+    active = set(range(len(paths)))
+    while active:
+        # 每条链路上活跃流还能平分的余量，取最小者作为本轮增量
+        step = min(remaining[link] / len(fs) for link, fs in users.items() if fs)
+        saturated = []
+        for link, fs in users.items():
+            if fs:
+                remaining[link] -= step * len(fs)
+                if remaining[link] <= 1e-12:
+                    saturated.append(link)
+        for f in active:
+            rates[f] += step
+        frozen = set()
+        for link in saturated:
+            frozen |= users[link]
+        active -= frozen
+        for fs in users.values():
+            fs -= frozen
+    return rates
+
+
+def throughput(table, matrix):
+    """(mean, min) per-source throughput as a fraction of the host NIC rate."""
+    flows = [(s, d) for s, d in matrix if s != d]
+    rates = max_min_rates([route(table, s, d) for s, d in flows])
+    per_src = {}
+    for (s, _), rate in zip(flows, rates):
+        per_src[s] = per_src.get(s, 0.0) + rate
+    values = list(per_src.values())
+    return sum(values) / len(values), min(values)
+
+
+def clos_for_ratio(k, edge_ratio, agg_ratio):
+    """Clos built from radix-k switches with H:A = edge_ratio and E:C = agg_ratio."""
+    hosts, rest = divmod(k * edge_ratio, edge_ratio + 1)
+    edges, rest2 = divmod(k * agg_ratio, agg_ratio + 1)
+    if rest or rest2:
+        return None
+    return FatTreeModel(k, pods=k, edges=edges, aggs=k - hosts, hosts=hosts, core_rows=k - edges)
+
+
+def run(models, seed=0, uplinks=None):
+    results = []
+    for model in models:
+        table = uplinks if uplinks is not None and uplinks.tiers == model.tiers \
+            else UplinkTable.for_model(model)
+        edge_os, agg_os = model.oversubscription
+        row = {
+            'tiers': model.tiers,
+            'edge_oversub': edge_os,
+            'agg_oversub': agg_os,
+            'switches': model.n_switches,
+            'hosts': model.n_hosts,
+            'hosts_per_switch': model.n_hosts / model.n_switches,
+            'throughput': {},
+        }
+        for name, matrix in default_matrices(model, seed).items():
+            mean, worst = throughput(table, matrix)
+            row['throughput'][name] = {'mean': mean, 'min': worst}
+        results.append(row)
+    return results
+
+
+def format_results(results):
+    names = list(results[0]['throughput'])
+    lines = [f"{'edge':>5} {'agg':>5} {'switches':>8} {'hosts':>6} {'h/sw':>5}  "
+             + ' '.join(f"{n:>10}" for n in names)]
+    for r in results:
+        lines.append(f"{r['edge_oversub']:>4g}:1 {r['agg_oversub']:>3g}:1 {r['switches']:>8} "
+                     f"{r['hosts']:>6} {r['hosts_per_switch']:>5.2f}  "
+                     + ' '.join(f"{r['throughput'][n]['mean']:>10.3f}" for n in names))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Throughput vs switch count for oversubscribed Clos.')
+    parser.add_argument('--k', type=int, default=8, help='Switch radix')
+    parser.add_argument('--edge-ratios', type=int, nargs='+', default=[1, 3],
+                        help='Edge oversubscription H:A ratios to try')
+    parser.add_argument('--agg-ratios', type=int, nargs='+', default=[1],
+                        help='Aggregation oversubscription E:C ratios to try')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--uplinks', default=None,
+                        help='Uplink table (fat_tree_uplinks.py) to use where its tiers match')
+    parser.add_argument('--json', default=None, help='Also write the results as JSON')
+    args = parser.parse_args()
+
+    models = []
+    for er in args.edge_ratios:
+        for ar in args.agg_ratios:
+            model = clos_for_ratio(args.k, er, ar)
+            if model is None:
+                print(f"skip edge {er}:1 agg {ar}:1 (does not divide k={args.k})")
+                continue
+            models.append(model)
+
+    uplinks = UplinkTable.load(args.uplinks) if args.uplinks else None
+    results = run(models, args.seed, uplinks)
+    print("mean per-host throughput (fraction of NIC rate), max-min fair:")
+    print(format_results(results))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
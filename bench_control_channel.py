@@ -0,0 +1,64 @@
+# Control-channel bytes per table-miss with and without packet-in buffering (no Ryu needed)
+#
+# 按 OpenFlow 1.3 报文格式计算每个 table-miss 包在控制通道上的字节数
+# (packet-in 上行 + packet-out 下行)，比较三种情况:
+#   off        : $FAT_TREE_CHANNEL=off，OFPCML_NO_BUFFER，整帧上送、整帧回送
+#   buffered   : 交换机缓存整帧，packet-in 只带前 miss_send_len 字节，packet-out 用 buffer_id
+#   ovs        : 交换机不缓存 (OVS >= 2.7)，control_channel 检测到后回退为 off，
+#                之后字节数与 off 相同 (回退前丢一个包)
+# 再按 --rate (每秒 table-miss 包数) 换算成 B/s。SetAsync 过滤掉的 port-status
+# (fat_tree_routing.py 不订阅) 每条 80 字节，按 --port-events 计入。
+#
+# Usage:
+#   python3 bench_control_channel.py --frames 64 590 1514 --rate 1000
+from control_channel import DEFAULT_MISS_SEND_LEN
+
+OFP_HEADER = 8
+# buffer_id, total_len, reason, table_id, cookie + ofp_match(in_port OXM, 补齐到 8 字节) + 2 字节 pad
+PACKET_IN_FIXED = OFP_HEADER + 16 + 16 + 2
+# buffer_id, in_port, actions_len, pad + 一个 OFPActionOutput
+PACKET_OUT_FIXED = OFP_HEADER + 16 + 16
+PORT_STATUS = 80
+
+CASES = ('off', 'buffered', 'ovs')
+
+
+def exchange_bytes(frame, case, miss_send_len=DEFAULT_MISS_SEND_LEN):
+    """(packet-in bytes, packet-out bytes) for one table-miss frame of ``frame`` bytes."""
+    if case == 'buffered':
+        return PACKET_IN_FIXED + min(frame, miss_send_len), PACKET_OUT_FIXED
+    return PACKET_IN_FIXED + frame, PACKET_OUT_FIXED + frame
+
+
+def run(frames, rate, port_events=0.0, miss_send_len=DEFAULT_MISS_SEND_LEN):
+    results = []
+    for frame in frames:
+        for case in CASES:
+            up, down = exchange_bytes(frame, case, miss_send_len)
+            # 只有 off 时 port-status 没被 SetAsync 过滤
+            status = PORT_STATUS * port_events if case == 'off' else 0.0
+            results.append({'frame': frame, 'case': case, 'packet_in': up, 'packet_out': down,
+                            'received_bps': up * rate + status, 'sent_bps': down * rate})
+    return results
+
+
+def format_results(results):
+    lines = [f"{'frame':>5} {'case':<9} {'pkt-in B':>8} {'pkt-out B':>9} {'recv B/s':>10} {'sent B/s':>10}"]
+    for r in results:
+        lines.append(f"{r['frame']:>5} {r['case']:<9} {r['packet_in']:>8} {r['packet_out']:>9} "
+                     f"{r['received_bps']:>10.0f} {r['sent_bps']:>10.0f}")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Control-channel bytes per table-miss packet.')
+    parser.add_argument('--frames', type=int, nargs='+', default=[64, 590, 1514],
+                        help='Ethernet frame sizes of the table-miss packets')
+    parser.add_argument('--rate', type=float, default=1000, help='Table-miss packets per second')
+    parser.add_argument('--port-events', type=float, default=0.0, help='Port-status events per second')
+    parser.add_argument('--miss-send-len', type=int, default=DEFAULT_MISS_SEND_LEN)
+    args = parser.parse_args()
+
+    print(format_results(run(args.frames, args.rate, args.port_events, args.miss_send_len)))
@@ -0,0 +1,105 @@
+# Table size per tier and reroute cost: IP prefix/suffix routing vs VLAN label routing
+#
+# 三种配置: ip (suffix 分流表)、ip-host (host 粒度分流表，与 label 一样能按目的主机
+# 选路径)、label。label 模式的 edge 表是 O(全部主机)，比 ip (suffix) 大；agg/core
+# 与 ip (suffix) 同量级，比 ip-host 的 agg (每台 N_hosts 条) 小得多。
+#
+# 用 bench_rule_generation.py 的 FakeDatapath，分别以各配置给整个 fabric 下发
+# 规则，统计每层每台交换机的 FlowMod 数 (= 表项数)；再对一组随机主机对调用
+# reroute()，统计需要改动的交换机数、FlowMod 数和串行 barrier 轮数 (每轮至少一个
+# 控制通道 RTT)。
+# 实际改路由延迟: Mininet 中用
+#   FAT_TREE_ROUTING_MODE=label FAT_TREE_STATS=1 FAT_TREE_REROUTE_INTERVAL=1 ryu-manager fat_tree_routing.py
+# 运行，比较两种模式下统计汇总里 'reroute' 的 p50/p99。
+#
+# Usage:
+#   python3 bench_label_routing.py --k 4 8 16
+import random
+from types import SimpleNamespace
+
+from bench_rule_generation import FakeDatapath, make_app
+from fat_tree_model import ROLE_NAMES
+from fat_tree_uplinks import UplinkTable
+
+# 名称 -> (路由模式, 分流表粒度)
+CONFIGS = {'ip': ('ip', 'suffix'), 'ip-host': ('ip', 'host'), 'label': ('label', 'suffix')}
+
+
+def _connect(app):
+    dps = {}
+    for sw in app.model.switches:
+        dp = dps[sw.dpid] = FakeDatapath(sw.dpid)
+        app.switch_features_handler(SimpleNamespace(msg=SimpleNamespace(datapath=dp)))
+    return dps
+
+
+def table_sizes(app, dps):
+    """{role: (max, mean) FlowMods per switch}."""
+    per_role = {role: [] for role in ROLE_NAMES}
+    for sw in app.model.switches:
+        sent = dps[sw.dpid].sent
+        per_role[sw.role_name].append(sum(1 for name, _ in sent if name == 'OFPFlowMod'))
+    return {role: (max(n), sum(n) / len(n)) for role, n in per_role.items() if n}
+
+
+def reroute_cost(app, dps, pairs, seed=0):
+    """Mean switches, FlowMods and sequential barrier rounds per reroute."""
+    rng = random.Random(seed)
+    for dp in dps.values():
+        dp.sent.clear()
+    switches = rounds = 0
+    for src, dst in pairs:
+        switches += app.reroute(src.ip, dst.ip, rng.randrange(app.model.aggs),
+                                rng.randrange(app.model.core_rows))
+        # 逐个应答 barrier，下一步在应答后才发出
+        while app.reroutes:
+            dpid, xid = next(iter(app.reroutes))
+            rounds += 1
+            msg = SimpleNamespace(datapath=dps[dpid], xid=xid)
+            app.barrier_reply_handler(SimpleNamespace(msg=msg))
+    flow_mods = sum(1 for dp in dps.values() for name, _ in dp.sent if name == 'OFPFlowMod')
+    n = len(pairs)
+    return {'switches': switches / n, 'flow_mods': flow_mods / n, 'barrier_rounds': rounds / n}
+
+
+def run_k(k, n_pairs=100, seed=0):
+    results = {}
+    for name, (mode, granularity) in CONFIGS.items():
+        app = make_app(k, mode)
+        app.uplinks = UplinkTable.for_model(app.model, granularity)
+        dps = _connect(app)
+        app.datapaths = dps
+        hosts = list(app.model.hosts())
+        rng = random.Random(seed)
+        pairs = []
+        while len(pairs) < n_pairs:
+            src, dst = rng.sample(hosts, 2)
+            if src.pod != dst.pod:
+                pairs.append((src, dst))
+        results[name] = {'tables': table_sizes(app, dps), 'reroute': reroute_cost(app, dps, pairs, seed)}
+    return results
+
+
+def format_results(k, results):
+    lines = [f"k={k}",
+             f"  {'config':<7} " + ' '.join(f"{role + ' max/mean':>17}" for role in ROLE_NAMES)
+             + f" {'reroute sw':>10} {'flowmods':>8} {'rounds':>6}"]
+    for mode, r in results.items():
+        tables = ' '.join(f"{r['tables'][role][0]:>8} / {r['tables'][role][1]:<6.1f}" for role in ROLE_NAMES)
+        rr = r['reroute']
+        lines.append(f"  {mode:<7} {tables} {rr['switches']:>10.2f} {rr['flow_mods']:>8.2f} "
+                     f"{rr['barrier_rounds']:>6.2f}")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compare IP (suffix/host) and label routing table sizes and reroute cost.')
+    parser.add_argument('--k', type=int, nargs='+', default=[4, 8, 16])
+    parser.add_argument('--pairs', type=int, default=100, help='Inter-pod flows to reroute')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for k in args.k:
+        print(format_results(k, run_k(k, args.pairs, args.seed)))
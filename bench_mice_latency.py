@@ -0,0 +1,190 @@
+# Mice (short RPC) latency under elephant load, with and without priority queuing
+#
+# pod 0 的主机向 pod 1 对应位置的主机发 iperf 长流 (elephant)，同时在相同的源/目的
+# 主机之间跑短 RPC (每次新建 TCP 连接，发请求、收响应后关闭)，统计每次 RPC 的完成
+# 时间 p50/p99。链路用 TCLink 限速；控制器开启 QoS 时 OVS 的 linux-htb 接管交换机
+# 端口的限速并分出 mice 队列。
+#
+# Usage (控制器分别以两种配置运行，结果追加到同一个 JSON):
+#   terminalA: FAT_TREE_LINK_MBPS=100 ryu-manager fat_tree_routing.py
+#   terminalB: sudo python3 bench_mice_latency.py --k 4 --bw 100 --label baseline --json mice.json
+#   terminalA: FAT_TREE_QOS=1 FAT_TREE_MICE_PORTS=5100 FAT_TREE_LINK_MBPS=100 ryu-manager fat_tree_routing.py
+#   terminalB: sudo python3 bench_mice_latency.py --k 4 --bw 100 --label qos --json mice.json
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from functools import partial
+
+from fat_tree_model import add_tier_arguments, model_from_args
+from fat_tree_qos import clear_command, find_command, parse_find, switch_ports
+
+RPC_PORT = 5100
+IPERF_PORT = 5001
+
+
+# === RPC endpoints (run inside the Mininet hosts) ===
+
+def serve(port, resp_size):
+    srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    srv.bind(('0.0.0.0', port))
+    srv.listen(128)
+    response = b'x' * resp_size
+    while True:
+        conn, _ = srv.accept()
+        with conn:
+            while conn.recv(65536):
+                pass
+            conn.sendall(response)
+
+
+def client(ip, port, count, req_size, interval):
+    """Latency (s) of ``count`` RPCs, each on a new connection; None for a failed one."""
+    request = b'x' * req_size
+    latencies = []
+    for _ in range(count):
+        t0 = time.perf_counter()
+        try:
+            with socket.create_connection((ip, port), timeout=5) as conn:
+                conn.sendall(request)
+                conn.shutdown(socket.SHUT_WR)
+                while conn.recv(65536):
+                    pass
+            latencies.append(time.perf_counter() - t0)
+        except OSError:
+            latencies.append(None)
+        time.sleep(interval)
+    return latencies
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+# === Experiment (run as root, controls Mininet) ===
+
+def pairs_for(model, n):
+    """(src host, dst host): pod 0 host -> same edge/slot in pod 1."""
+    pairs = [(h, model.host_by_ip(f'10.1.{h.edge}.{h.slot + 2}')) for h in model.hosts() if h.pod == 0]
+    return pairs[:n]
+
+
+def clear_qos(model):
+    """Remove the QoS/Queue rows the controller created for ``model``'s switches.
+
+    控制器建的 QoS/Queue 不随 Mininet 删除；按 owner 标签找，只删这些行。
+    """
+    ports, stale = [], []
+    for sw in model.switches:
+        ports += switch_ports(model, sw)
+        found = subprocess.run(find_command(sw.name), capture_output=True, text=True)
+        if found.returncode == 0:
+            stale += parse_find(found.stdout)
+    subprocess.run(clear_command(ports, stale), capture_output=True)
+
+
+def run(net, model, elephants=2, duration=20, warmup=3, count=200, req_size=100, resp_size=1000,
+        interval=0.02, load=True):
+    """Mice RPC latency summary while ``elephants`` iperf flows run (if ``load``)."""
+    script = os.path.abspath(__file__)
+    procs = []
+    pairs = pairs_for(model, elephants)
+    for _, dst in pairs:
+        host = net.get(dst.name)
+        procs.append(host.popen(['iperf', '-s', '-p', str(IPERF_PORT)]))
+        procs.append(host.popen([sys.executable, script, '--serve', str(RPC_PORT), '--resp', str(resp_size)]))
+    time.sleep(1)
+    if load:
+        for src, dst in pairs:
+            procs.append(net.get(src.name).popen(['iperf', '-c', dst.ip, '-p', str(IPERF_PORT),
+                                                  '-t', str(duration)]))
+        time.sleep(warmup)
+
+    clients = [net.get(src.name).popen([sys.executable, script, '--client', dst.ip, str(RPC_PORT),
+                                        '--count', str(count), '--req', str(req_size),
+                                        '--interval', str(interval)])
+               for src, dst in pairs]
+    latencies = []
+    for proc in clients:
+        out, _ = proc.communicate()
+        latencies.extend(json.loads(out))
+    for proc in procs:
+        proc.terminate()
+        proc.wait()
+
+    done = [lat for lat in latencies if lat is not None]
+    return {
+        'elephants': len(pairs) if load else 0,
+        'rpcs': len(latencies),
+        'failed': len(latencies) - len(done),
+        'p50_ms': percentile(done, 0.50) * 1e3 if done else None,
+        'p99_ms': percentile(done, 0.99) * 1e3 if done else None,
+        'mean_ms': sum(done) / len(done) * 1e3 if done else None,
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Mice RPC latency alongside iperf elephants.')
+    add_tier_arguments(parser)
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--client', nargs=2, metavar=('IP', 'PORT'), help=argparse.SUPPRESS)
+    parser.add_argument('--resp', type=int, default=1000, help='RPC response bytes')
+    parser.add_argument('--req', type=int, default=100, help='RPC request bytes')
+    parser.add_argument('--count', type=int, default=200, help='RPCs per client')
+    parser.add_argument('--interval', type=float, default=0.02)
+    parser.add_argument('--elephants', type=int, default=2)
+    parser.add_argument('--duration', type=int, default=20, help='iperf seconds')
+    parser.add_argument('--bw', type=float, default=100, help='Link rate in Mbit/s')
+    parser.add_argument('--no-load', action='store_true', help='Measure without elephants')
+    parser.add_argument('--label', default='run')
+    parser.add_argument('--json', default=None, help='Append the result to this JSON list')
+    args = parser.parse_args()
+
+    # 在 Mininet 主机里以 RPC 服务端 / 客户端运行
+    if args.serve:
+        serve(args.serve, args.resp)
+        sys.exit(0)
+    if args.client:
+        ip, port = args.client
+        print(json.dumps(client(ip, int(port), args.count, args.req, args.interval)))
+        sys.exit(0)
+
+    from mininet.net import Mininet
+    from mininet.link import TCLink
+    from mininet.node import RemoteController
+    from fat_tree_topology2 import FatTreeTopo
+
+    model = model_from_args(args)
+    net = Mininet(topo=FatTreeTopo(model=model), link=partial(TCLink, bw=args.bw), controller=None,
+                  autoSetMacs=True, autoStaticArp=True)
+    net.addController('controller', controller=RemoteController,
+                      ip='127.0.0.1', port=6633, protocols='OpenFlow13')
+    net.start()
+    try:
+        net.waitConnected()
+        net.pingAll()
+        result = run(net, model, args.elephants, args.duration, count=args.count, req_size=args.req,
+                     resp_size=args.resp, interval=args.interval, load=not args.no_load)
+    finally:
+        clear_qos(model)
+        net.stop()
+
+    result.update(label=args.label, fabric=model.describe(), bw_mbps=args.bw)
+    print(f"{args.label}: {result['rpcs']} RPCs ({result['failed']} failed) with {result['elephants']} "
+          f"elephants, p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms")
+    if args.json:
+        results = []
+        if os.path.exists(args.json):
+            with open(args.json) as f:
+                results = json.load(f)
+        results.append(result)
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,205 @@
+# Socket-free benchmark for FatTreeRouting rule generation (no Mininet needed)
+#
+# 用内存中的 FakeDatapath 替代真实交换机：switch_features_handler 发出的每条
+# 消息都照常 serialize()，只记录类型和编码后字节数。对 k = 4..64 统计各角色
+# 和整个 fabric 的耗时、消息数、字节数和峰值内存。
+#
+# Usage:
+#   python3 bench_rule_generation.py                       # 打印结果
+#   python3 bench_rule_generation.py --save                # 写入基线 bench_baseline.json
+#   python3 bench_rule_generation.py --check               # 与基线比较，回归时退出码 1
+#
+# 消息数和字节数是确定的，仓库里提交的 bench_baseline.json 只含这两项 (以及交换机数)，
+# --check 在任何机器上都能用。耗时/内存与机器有关，只在 --timing 时保存和比较。
+import json
+import logging
+import os
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from ryu.ofproto import ofproto_v1_3
+from ryu.ofproto import ofproto_v1_3_parser
+
+from fat_tree_labels import LabelPlan
+from fat_tree_model import FatTreeModel, ROLE_NAMES
+from fat_tree_multicast import broadcast_forwarding
+from controller_stats import STATS
+from fat_tree_routing import FatTreeRouting
+from fat_tree_uplinks import UplinkTable
+
+DEFAULT_BASELINE_PATH = 'bench_baseline.json'
+DEFAULT_KS = (4, 8, 16, 32, 64)
+SCOPES = ROLE_NAMES + ('fabric',)
+COUNT_KEYS = ('switches', 'messages', 'bytes')
+TIMING_KEYS = ('time_s', 'peak_kib')
+
+
+class FakeDatapath:
+    """Minimal stand-in for ryu.controller.controller.Datapath."""
+
+    def __init__(self, dpid):
+        self.id = dpid
+        self.ofproto = ofproto_v1_3
+        self.ofproto_parser = ofproto_v1_3_parser
+        self.xid = 0
+        self.sent = []            # (msg type, encoded bytes)
+
+    def set_xid(self, msg):
+        self.xid = (self.xid + 1) & self.ofproto.MAX_XID
+        msg.set_xid(self.xid)
+        return self.xid
+
+    def send_msg(self, msg):
+        # 与 Datapath.send_msg 相同: 分配 xid 后同步编码
+        if msg.xid is None:
+            self.set_xid(msg)
+        msg.serialize()
+        self.sent.append((type(msg).__name__, len(msg.buf)))
+        return True
+
+
+def make_app(k, mode='ip'):
+    # 不读当前目录的 fat_tree_model.json / fat_tree_uplinks.json，也不受 $FAT_TREE_*
+    # (QoS、elastic、改路由线程等) 影响，结果只取决于 k 和 mode
+    saved = {key: os.environ.pop(key) for key in list(os.environ) if key.startswith('FAT_TREE_')}
+    pinned = {'FAT_TREE_MODEL': '', 'FAT_TREE_UPLINKS': '', 'FAT_TREE_K': str(k)}
+    os.environ.update(pinned)
+    try:
+        app = FatTreeRouting()
+    finally:
+        for key in pinned:
+            del os.environ[key]
+        os.environ.update(saved)
+    app.logger.setLevel(logging.WARNING)
+    app.model = FatTreeModel(k)
+    app.k = k
+    app.uplinks = UplinkTable.for_model(app.model)
+    app.broadcast = broadcast_forwarding(app.model)
+    app.mode = mode
+    app.labels = LabelPlan(app.model) if mode == 'label' else None
+    return app
+
+
+def _empty():
+    return {'switches': 0, 'time_s': 0.0, 'messages': 0, 'bytes': 0, 'peak_kib': 0.0}
+
+
+def run_k(k):
+    """Program every switch of a k-ary fabric once; return metrics per scope."""
+    app = make_app(k)
+    results = {scope: _empty() for scope in SCOPES}
+
+    # Pass 1: wall time, messages and bytes (tracemalloc off)
+    for sw in app.model.switches:
+        dp = FakeDatapath(sw.dpid)
+        ev = SimpleNamespace(msg=SimpleNamespace(datapath=dp))
+        t0 = time.perf_counter()
+        app.switch_features_handler(ev)
+        elapsed = time.perf_counter() - t0
+        for scope in (sw.role_name, 'fabric'):
+            r = results[scope]
+            r['switches'] += 1
+            r['time_s'] += elapsed
+            r['messages'] += len(dp.sent)
+            r['bytes'] += sum(n for _, n in dp.sent)
+
+    # Pass 2: peak memory per switch (role) and for the whole fabric
+    app = make_app(k)
+    tracemalloc.start()
+    fabric_peak = 0
+    for sw in app.model.switches:
+        dp = FakeDatapath(sw.dpid)
+        ev = SimpleNamespace(msg=SimpleNamespace(datapath=dp))
+        tracemalloc.reset_peak()
+        app.switch_features_handler(ev)
+        peak = tracemalloc.get_traced_memory()[1]
+        fabric_peak = max(fabric_peak, peak)
+        r = results[sw.role_name]
+        r['peak_kib'] = max(r['peak_kib'], peak / 1024)
+    tracemalloc.stop()
+    results['fabric']['peak_kib'] = fabric_peak / 1024
+    return results
+
+
+def run(ks=DEFAULT_KS):
+    return {str(k): run_k(k) for k in ks}
+
+
+def counts_only(results):
+    """The deterministic part of run() results (what the committed baseline holds)."""
+    return {k: {scope: {key: r[key] for key in COUNT_KEYS} for scope, r in scopes.items()}
+            for k, scopes in results.items()}
+
+
+def compare(baseline, current, time_tolerance=0.25, timing=False):
+    """Return regression messages (empty list if none).
+
+    Messages and bytes must not grow. With ``timing``, time and memory may
+    grow by ``time_tolerance`` (relative) to absorb machine noise; they are
+    only compared where the baseline has them.
+    """
+    problems = []
+    for k, scopes in current.items():
+        base_scopes = baseline.get(k)
+        if base_scopes is None:
+            continue
+        for scope, cur in scopes.items():
+            base = base_scopes.get(scope)
+            if base is None:
+                continue
+            for key in ('messages', 'bytes'):
+                if cur[key] > base[key]:
+                    problems.append(f"k={k} {scope} {key}: {base[key]} -> {cur[key]}")
+            for key in TIMING_KEYS if timing else ():
+                if base.get(key) and cur[key] > base[key] * (1 + time_tolerance):
+                    problems.append(f"k={k} {scope} {key}: {base[key]:.4f} -> {cur[key]:.4f}")
+    return problems
+
+
+def format_results(results):
+    lines = [f"{'k':>3} {'scope':<7} {'switches':>8} {'time_ms':>10} {'messages':>9} "
+             f"{'bytes':>10} {'peak_KiB':>9}"]
+    for k, scopes in results.items():
+        for scope in SCOPES:
+            r = scopes[scope]
+            lines.append(f"{k:>3} {scope:<7} {r['switches']:>8} {r['time_s'] * 1e3:>10.2f} "
+                         f"{r['messages']:>9} {r['bytes']:>10} {r['peak_kib']:>9.1f}")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Benchmark FatTreeRouting rule generation.')
+    parser.add_argument('--k', type=int, nargs='+', default=list(DEFAULT_KS),
+                        help='Fat-tree sizes to sweep (even)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH)
+    parser.add_argument('--save', action='store_true', help='Write results as the new baseline')
+    parser.add_argument('--check', action='store_true', help='Fail on regression against the baseline')
+    parser.add_argument('--timing', action='store_true',
+                        help='Also save/compare time and memory (machine-specific)')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed relative growth of time/memory with --check --timing')
+    args = parser.parse_args()
+
+    if STATS.enabled:
+        sys.exit("unset FAT_TREE_STATS: handler timing would be included in the results")
+    if args.check and not os.path.exists(args.baseline):
+        sys.exit(f"no baseline at {args.baseline}; run with --save first")
+
+    results = run(args.k)
+    print(format_results(results))
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(results if args.timing else counts_only(results), f, indent=2, sort_keys=True)
+        print(f"baseline -> {args.baseline}")
+
+    if args.check:
+        with open(args.baseline) as f:
+            problems = compare(json.load(f), results, args.tolerance, args.timing)
+        for p in problems:
+            print(f"REGRESSION {p}")
+        sys.exit(1 if problems else 0)
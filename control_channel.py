@@ -0,0 +1,101 @@
+# Control-channel configuration applied at switch-features time
+#
+# 减少交换机发往控制器的异步消息和 packet-in 大小:
+#   - OFPSetAsync: 只订阅应用真正处理的 packet-in / port-status / flow-removed 原因
+#   - OFPSetConfig + table-miss max_len: 交换机侧缓存报文，packet-in 只带前 N 字节，
+#     packet-out 用 buffer_id 回送，不再把整帧来回传
+# 交换机不支持时自动回退:
+#   - 收到 SetAsync/SetConfig 的错误 -> 记录并沿用交换机默认行为
+#   - packet-in 没有 buffer_id 却被截断 (OVS >= 2.7 不再缓存) -> 该交换机改回
+#     OFPCML_NO_BUFFER，调用方重装 table-miss
+#
+# $FAT_TREE_CHANNEL=off 关闭整个配置层 (用于对比前后的控制通道字节数)。
+import os
+
+from controller_stats import STATS
+
+PACKET_IN_REASONS = ('no_match', 'action', 'invalid_ttl')
+PORT_STATUS_REASONS = ('add', 'delete', 'modify')
+FLOW_REMOVED_REASONS = ('idle_timeout', 'hard_timeout', 'delete', 'group_delete')
+
+DEFAULT_MISS_SEND_LEN = 128
+
+
+def _mask(ofproto, prefix, names):
+    mask = 0
+    for name in names:
+        mask |= 1 << getattr(ofproto, f'{prefix}{name.upper()}')
+    return mask
+
+
+class ControlChannel:
+    """Per-app async-message filter and packet-in buffering policy."""
+
+    def __init__(self, logger, packet_in=PACKET_IN_REASONS, port_status=PORT_STATUS_REASONS,
+                 flow_removed=(), miss_send_len=DEFAULT_MISS_SEND_LEN):
+        self.logger = logger
+        self.enabled = os.environ.get('FAT_TREE_CHANNEL', 'on') != 'off'
+        self.packet_in = tuple(packet_in)
+        self.port_status = tuple(port_status)
+        self.flow_removed = tuple(flow_removed)
+        self.miss_send_len = miss_send_len
+        self.no_buffer = set()      # dpids that do not buffer packet-ins
+        self.pending = {}           # dpid -> {xid: request name}, for error matching
+
+    def configure(self, dp):
+        """Send SetConfig/SetAsync; call first in the switch-features handler."""
+        if not self.enabled:
+            return
+        ofproto = dp.ofproto
+        parser = dp.ofproto_parser
+        self.pending[dp.id] = {}
+
+        if self.miss_send_len is not None and dp.id not in self.no_buffer:
+            req = parser.OFPSetConfig(dp, ofproto.OFPC_FRAG_NORMAL, self.miss_send_len)
+            self._send(dp, req, 'set_config')
+
+        packet_in = _mask(ofproto, 'OFPR_', self.packet_in)
+        port_status = _mask(ofproto, 'OFPPR_', self.port_status)
+        flow_removed = _mask(ofproto, 'OFPRR_', self.flow_removed)
+        # [master/equal, slave]: slave 角色不需要任何异步消息
+        req = parser.OFPSetAsync(dp, [packet_in, 0], [port_status, 0], [flow_removed, 0])
+        self._send(dp, req, 'set_async')
+
+    def _send(self, dp, msg, name):
+        dp.send_msg(msg)
+        STATS.sent(dp.id, msg)
+        if msg.xid is not None:
+            self.pending[dp.id][msg.xid] = name
+
+    def miss_max_len(self, dp):
+        """max_len for OFPActionOutput(OFPP_CONTROLLER) in the table-miss entry."""
+        if not self.enabled or self.miss_send_len is None or dp.id in self.no_buffer:
+            return dp.ofproto.OFPCML_NO_BUFFER
+        return self.miss_send_len
+
+    def usable(self, msg):
+        """False if a packet-in was truncated without a buffer (switch cannot buffer).
+
+        The switch is switched to OFPCML_NO_BUFFER; the caller should reinstall
+        its table-miss entry with miss_max_len() and drop this packet.
+        """
+        dp = msg.datapath
+        if msg.buffer_id != dp.ofproto.OFP_NO_BUFFER or len(msg.data) >= msg.total_len:
+            return True
+        if dp.id not in self.no_buffer:
+            self.no_buffer.add(dp.id)
+            self.logger.warning("DPID=%016x does not buffer packet-ins, falling back to NO_BUFFER",
+                                dp.id)
+        return False
+
+    def handle_error(self, msg):
+        """Match an OFPErrorMsg to a request sent here; True if it was ours."""
+        dpid = msg.datapath.id
+        name = self.pending.get(dpid, {}).pop(msg.xid, None)
+        if name is None:
+            return False
+        if name == 'set_config':
+            self.no_buffer.add(dpid)
+        self.logger.warning("DPID=%016x rejected %s (type=%d code=%d), using switch defaults",
+                            dpid, name, msg.type, msg.code)
+        return True
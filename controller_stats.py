@@ -0,0 +1,218 @@
+# Lightweight hot-path instrumentation for the Ryu apps
+#
+# 开关 (环境变量，进程启动时读取一次):
+#   FAT_TREE_STATS=1               启用统计；未设置时 timed() 直接返回原函数，
+#                                  STATS 为空实现，开销接近 0
+#   FAT_TREE_STATS_INTERVAL=10     周期汇总间隔 (秒)
+#   FAT_TREE_STATS_DUMP=stats.json 每次汇总同时写出 JSON
+#
+# 用法:
+#   @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
+#   @timed('switch_features')
+#   def switch_features_handler(self, ev): ...
+#
+#   dp.send_msg(mod)
+#   STATS.sent(dp.id, mod)
+#   STATS.recv(dp.id, ev.msg)      # 收到的消息 (packet-in 等)
+import functools
+import json
+import os
+import time
+
+N_BUCKETS = 32  # log2(us) buckets: [0,1us), [1,2us), [2,4us), ...
+
+
+class Histogram:
+    __slots__ = ('buckets', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.buckets = [0] * N_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        us = int(seconds * 1e6)
+        self.buckets[min(us.bit_length(), N_BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """Upper bound (seconds) of the bucket holding quantile q."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target:
+                return min((1 << i) / 1e6, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count * 1e3 if self.count else 0.0,
+            'p50_ms': self.quantile(0.5) * 1e3,
+            'p99_ms': self.quantile(0.99) * 1e3,
+            'max_ms': self.max * 1e3,
+        }
+
+
+class ControllerStats:
+    enabled = True
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = time.time()
+        self.handlers = {}        # handler name -> Histogram
+        self.messages = {}        # (dpid, msg type) -> [count, bytes]
+        self.received = {}        # (dpid, msg type) -> [count, bytes]
+        self.queue_depth = {}     # handler name -> [last, max]
+
+    def observe(self, name, seconds):
+        hist = self.handlers.get(name)
+        if hist is None:
+            hist = self.handlers[name] = Histogram()
+        hist.add(seconds)
+
+    def sent(self, dpid, msg):
+        key = (dpid, type(msg).__name__)
+        entry = self.messages.get(key)
+        if entry is None:
+            entry = self.messages[key] = [0, 0]
+        entry[0] += 1
+        # Ryu 的 send_msg 会同步 serialize()，此时 buf 已是编码后的报文
+        entry[1] += len(getattr(msg, 'buf', None) or b'')
+
+    def recv(self, dpid, msg):
+        key = (dpid, type(msg).__name__)
+        entry = self.received.get(key)
+        if entry is None:
+            entry = self.received[key] = [0, 0]
+        entry[0] += 1
+        entry[1] += len(getattr(msg, 'buf', None) or b'')
+
+    def depth(self, name, depth):
+        entry = self.queue_depth.get(name)
+        if entry is None:
+            entry = self.queue_depth[name] = [0, 0]
+        entry[0] = depth
+        if depth > entry[1]:
+            entry[1] = depth
+
+    def summary(self):
+        per_type = {}
+        per_switch = {}
+        for (dpid, msg_type), (count, nbytes) in self.messages.items():
+            t = per_type.setdefault(msg_type, {'count': 0, 'bytes': 0})
+            t['count'] += count
+            t['bytes'] += nbytes
+            s = per_switch.setdefault(format(dpid, '016x'), {})
+            s[msg_type] = count
+        received = {}
+        for (_, msg_type), (count, nbytes) in self.received.items():
+            t = received.setdefault(msg_type, {'count': 0, 'bytes': 0})
+            t['count'] += count
+            t['bytes'] += nbytes
+        uptime = time.time() - self.started
+        return {
+            'uptime_s': uptime,
+            'handlers': {name: h.summary() for name, h in self.handlers.items()},
+            'messages': per_type,
+            'messages_per_switch': per_switch,
+            'received': received,
+            # 控制通道带宽 (两个方向)
+            'sent_bytes_per_s': sum(t['bytes'] for t in per_type.values()) / uptime,
+            'received_bytes_per_s': sum(t['bytes'] for t in received.values()) / uptime,
+            'queue_depth': {name: {'last': last, 'max': peak}
+                            for name, (last, peak) in self.queue_depth.items()},
+        }
+
+    def format_summary(self):
+        lines = [f"controller stats ({time.time() - self.started:.0f}s)"]
+        for name, h in sorted(self.handlers.items()):
+            s = h.summary()
+            q = self.queue_depth.get(name, (0, 0))
+            lines.append(f"  {name:<24} n={s['count']:<7} mean={s['mean_ms']:.3f}ms "
+                         f"p50<={s['p50_ms']:.3f}ms p99<={s['p99_ms']:.3f}ms "
+                         f"max={s['max_ms']:.3f}ms queue={q[0]}/{q[1]}")
+        summary = self.summary()
+        for msg_type, t in sorted(summary['messages'].items()):
+            lines.append(f"  sent {msg_type:<19} n={t['count']:<7} bytes={t['bytes']}")
+        for msg_type, t in sorted(summary['received'].items()):
+            lines.append(f"  recv {msg_type:<19} n={t['count']:<7} bytes={t['bytes']}")
+        lines.append(f"  control channel: sent {summary['sent_bytes_per_s']:.0f} B/s, "
+                     f"received {summary['received_bytes_per_s']:.0f} B/s")
+        return '\n'.join(lines)
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+
+class NullStats:
+    """Disabled mode: every call is a no-op."""
+    enabled = False
+
+    def reset(self):
+        pass
+
+    def observe(self, name, seconds):
+        pass
+
+    def sent(self, dpid, msg):
+        pass
+
+    def recv(self, dpid, msg):
+        pass
+
+    def depth(self, name, depth):
+        pass
+
+    def summary(self):
+        return {}
+
+    def format_summary(self):
+        return 'controller stats disabled'
+
+    def dump(self, path):
+        pass
+
+
+STATS = ControllerStats() if os.environ.get('FAT_TREE_STATS') else NullStats()
+
+
+def timed(name):
+    """Record handler latency and the app's event queue depth on entry."""
+    def decorator(handler):
+        if not STATS.enabled:
+            return handler
+
+        @functools.wraps(handler)
+        def wrapper(self, ev):
+            events = getattr(self, 'events', None)
+            if events is not None:
+                STATS.depth(name, events.qsize())
+            t0 = time.perf_counter()
+            try:
+                return handler(self, ev)
+            finally:
+                STATS.observe(name, time.perf_counter() - t0)
+        return wrapper
+    return decorator
+
+
+def stats_loop(logger, sleep, interval=None, path=None):
+    """Periodic summary; run with hub.spawn(stats_loop, self.logger, hub.sleep)."""
+    interval = interval or float(os.environ.get('FAT_TREE_STATS_INTERVAL', 10))
+    path = path or os.environ.get('FAT_TREE_STATS_DUMP')
+    while True:
+        sleep(interval)
+        logger.info("%s", STATS.format_summary())
+        if path:
+            STATS.dump(path)
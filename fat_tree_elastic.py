@@ -0,0 +1,254 @@
+# ElasticTree-style consolidation: fewest agg planes / core rows for the measured demand
+#
+# 按层估算需要的容量 (ElasticTree 的 topology-aware 启发式):
+#   agg planes A' : max over edge 的 max(上行, 下行) / (链路容量 * (1 - headroom))
+#   core rows  C' : max over pod 的 max(出 pod, 进 pod) / A' / (链路容量 * (1 - headroom))
+# 只保留 plane 0..A'-1 的 agg 和这些 plane 上 row 0..C'-1 的 core，上行分流表的
+# 取值限制在活跃集合内，其它 agg/core 不再有流量，标记为 drainable (可下电)。
+# 静态分流不会完全均匀，所以任一活跃上行链路超过 1 - headroom 时再多开一层
+# (edge-agg 链路热 -> plane + 1，agg-core 链路热 -> row + 1)。
+# 需求增长时立即扩回；缩小要连续 shrink_after 轮都建议更小的集合，避免抖动。
+# 组播树的根 (core row, plane) 在控制器里取模到活跃集合内；reroute() 固定的路径
+# 不受分流表限制，经过的交换机计入活跃集合。
+#
+# 控制器里 ($FAT_TREE_ELASTIC=<秒>) 用 edge / agg 上行端口的 OFPPortStats 计数估算
+# 需求；离线用已有的流量矩阵比较活跃交换机数与吞吐损失:
+#   python3 fat_tree_elastic.py --k 8 --loads 0.1 0.25 0.5 1.0 --headroom 0.3
+import math
+from array import array
+
+from bench_clos_capacity import max_min_rates
+from fat_tree_model import ROLE_AGG, ROLE_CORE, ROLE_EDGE, add_tier_arguments, model_from_args
+from fat_tree_uplinks import UplinkTable, default_matrices, route
+
+DEFAULT_HEADROOM = 0.3
+DEFAULT_SHRINK_AFTER = 3
+
+
+def needed(demand, capacity, headroom, limit):
+    """Links of ``capacity`` needed to carry ``demand`` below 1 - headroom utilization."""
+    usable = capacity * (1 - headroom)
+    return min(max(1, math.ceil(demand / usable - 1e-9)), limit)
+
+
+def plan(model, edge_demand, pod_demand, capacity=1.0, headroom=DEFAULT_HEADROOM):
+    """(agg planes, core rows) for the largest per-edge and per-pod demand."""
+    planes = needed(max(edge_demand, default=0.0), capacity, headroom, model.aggs)
+    rows = needed(max(pod_demand, default=0.0) / planes, capacity, headroom, model.core_rows)
+    return planes, rows
+
+
+def grow(model, planes, rows, hot_edge, hot_core):
+    """One step up from (planes, rows) for hot edge-agg / agg-core links."""
+    if hot_core and rows < model.core_rows:
+        rows += 1
+    elif hot_core:
+        hot_edge = True         # core 层已全开，多开 plane 也能分担
+    if hot_edge and planes < model.aggs:
+        planes += 1
+    return planes, rows
+
+
+def restrict(table, planes, rows):
+    """Copy of an uplink table whose entries only use agg planes < planes and core rows < rows."""
+    return UplinkTable(**table.tiers, granularity=table.granularity,
+                       edge=array('B', (a % planes for a in table.edge)),
+                       agg=array('B', (j % rows for j in table.agg)))
+
+
+def active_switches(model, planes, rows, pins=()):
+    """Switch indices that carry traffic with ``planes`` agg planes and ``rows`` core rows.
+
+    ``pins`` are (src Host, dst Host, agg, row) paths fixed outside the uplink
+    table (reroute()); their switches stay active whatever the planes/rows.
+    """
+    active = set()
+    for sw in model.switches:
+        if sw.role == ROLE_EDGE \
+                or (sw.role == ROLE_AGG and sw.position < planes) \
+                or (sw.role == ROLE_CORE and sw.position < planes and sw.pod < rows):
+            active.add(sw.index)
+    for src, dst, agg, row in pins:
+        active.add(model.agg_index(src.pod, agg))
+        if src.pod != dst.pod:
+            active.add(model.core_index(row, agg))
+            active.add(model.agg_index(dst.pod, agg))
+    return active
+
+
+class PortCounters:
+    """Byte counters -> rates (bytes/s) per (dpid, port)."""
+
+    def __init__(self):
+        self.last = {}
+
+    def update(self, key, rx_bytes, tx_bytes, now):
+        """(rx rate, tx rate), or None for the first sample of a port."""
+        prev = self.last.get(key)
+        self.last[key] = (rx_bytes, tx_bytes, now)
+        if prev is None or now <= prev[2]:
+            return None
+        dt = now - prev[2]
+        return (rx_bytes - prev[0]) / dt, (tx_bytes - prev[1]) / dt
+
+
+class Consolidator:
+    """Tracks uplink-port rates and picks the active (planes, rows) with hysteresis."""
+
+    def __init__(self, model, capacity, headroom=DEFAULT_HEADROOM, shrink_after=DEFAULT_SHRINK_AFTER):
+        self.model = model
+        self.capacity = capacity
+        self.headroom = headroom
+        self.shrink_after = shrink_after
+        self.counters = PortCounters()
+        self.edge_rates = {}        # (pod, edge) -> {port: (down, up)}
+        self.agg_rates = {}         # (pod, agg) -> {port: (down, up)}
+        self.current = (model.aggs, model.core_rows)
+        self.low_rounds = 0
+        self.hot = set()            # ROLE_EDGE / ROLE_AGG: 该层有上行端口超过 1 - headroom
+
+    def observe(self, sw, port, rx_bytes, tx_bytes, now):
+        """Feed one OFPPortStats entry of an edge/agg switch."""
+        if sw.role == ROLE_EDGE:
+            first_uplink, rates = self.model.hosts_per_edge + 1, self.edge_rates
+        elif sw.role == ROLE_AGG:
+            first_uplink, rates = self.model.edges + 1, self.agg_rates
+        else:
+            return
+        if not first_uplink <= port < self.model.stride:
+            return
+        rate = self.counters.update((sw.dpid, port), rx_bytes, tx_bytes, now)
+        if rate is not None:
+            rates.setdefault((sw.pod, sw.position), {})[port] = rate
+            if max(rate) > self.capacity * (1 - self.headroom):
+                self.hot.add(sw.role)
+
+    def demand(self):
+        """(per-edge demand, per-pod demand) in bytes/s, max of both directions."""
+        edge = [max(sum(d for d, _ in ports.values()), sum(u for _, u in ports.values()))
+                for ports in self.edge_rates.values()]
+        pods = {}
+        for (pod, _), ports in self.agg_rates.items():
+            down, up = pods.get(pod, (0.0, 0.0))
+            pods[pod] = (down + sum(d for d, _ in ports.values()), up + sum(u for _, u in ports.values()))
+        return edge, [max(d, u) for d, u in pods.values()]
+
+    def decide(self):
+        """Active (planes, rows) after this round; grows at once, shrinks after shrink_after rounds."""
+        if not self.edge_rates:
+            return self.current     # 还没有两次采样，不做判断
+        want = plan(self.model, *self.demand(), self.capacity, self.headroom)
+        if self.hot:
+            step = grow(self.model, *self.current, ROLE_EDGE in self.hot, ROLE_AGG in self.hot)
+            want = tuple(map(max, want, step))
+            self.hot.clear()
+        grown = tuple(max(w, c) for w, c in zip(want, self.current))
+        if grown != self.current:
+            self.current = grown
+            self.low_rounds = 0
+        elif want != self.current:
+            self.low_rounds += 1
+            if self.low_rounds >= self.shrink_after:
+                self.current = want
+                self.low_rounds = 0
+        else:
+            self.low_rounds = 0
+        return self.current
+
+
+# === Offline evaluation ===
+
+def offered(matrix, load):
+    """Per-flow demand so that every source offers ``load`` (fraction of its NIC)."""
+    fanout = {}
+    for s, d in matrix:
+        if s != d:
+            fanout[s] = fanout.get(s, 0) + 1
+    return [(s, d, load / fanout[s]) for s, d in matrix if s != d]
+
+
+def matrix_demand(model, flows):
+    """(per-edge demand, per-pod demand) of a demand list, in NIC-rate units."""
+    H, per_pod = model.hosts_per_edge, model.edges * model.hosts_per_edge
+    n_edges = model.pods * model.edges
+    edge_up, edge_down = [0.0] * n_edges, [0.0] * n_edges
+    pod_up, pod_down = [0.0] * model.pods, [0.0] * model.pods
+    for s, d, rate in flows:
+        if s // H != d // H:
+            edge_up[s // H] += rate
+            edge_down[d // H] += rate
+        if s // per_pod != d // per_pod:
+            pod_up[s // per_pod] += rate
+            pod_down[d // per_pod] += rate
+    return list(map(max, edge_up, edge_down)), list(map(max, pod_up, pod_down))
+
+
+def fit(model, full, flows, headroom=DEFAULT_HEADROOM):
+    """plan() for a known demand list, grown until no active link exceeds 1 - headroom."""
+    planes, rows = plan(model, *matrix_demand(model, flows), 1.0, headroom)
+    while True:
+        table = restrict(full, planes, rows)
+        loads = {}
+        for s, d, rate in flows:
+            for link in route(table, s, d):
+                loads[link] = loads.get(link, 0.0) + rate
+        hot = {link[0] for link, load in loads.items() if load > 1 - headroom + 1e-9}
+        step = grow(model, planes, rows, bool(hot & {'edge_up', 'agg_down'}),
+                    bool(hot & {'agg_up', 'core_down'}))
+        if step == (planes, rows):
+            return planes, rows, table
+        planes, rows = step
+
+
+def delivered(table, flows):
+    """(fraction of offered demand delivered, max link utilization) under max-min sharing."""
+    paths = []
+    capacities = {}
+    for f, (s, d, rate) in enumerate(flows):
+        paths.append(route(table, s, d) + [('demand', f)])
+        capacities[('demand', f)] = rate
+    rates = max_min_rates(paths, capacities)
+    loads = {}
+    for links, rate in zip(paths, rates):
+        for link in links[:-1]:
+            loads[link] = loads.get(link, 0.0) + rate
+    return sum(rates) / sum(rate for _, _, rate in flows), max(loads.values())
+
+
+def run(model, loads, headroom=DEFAULT_HEADROOM, seed=0):
+    full = UplinkTable.for_model(model)
+    results = []
+    for name, matrix in default_matrices(model, seed).items():
+        for load in loads:
+            flows = offered(matrix, load)
+            planes, rows, table = fit(model, full, flows, headroom)
+            ratio, util = delivered(table, flows)
+            results.append({'matrix': name, 'load': load, 'planes': planes, 'rows': rows,
+                            'active': len(active_switches(model, planes, rows)),
+                            'switches': model.n_switches, 'loss': 1 - ratio,
+                            'full_loss': 1 - delivered(full, flows)[0], 'max_util': util})
+    return results
+
+
+def format_results(results):
+    lines = [f"{'matrix':<13} {'load':>5} {'planes':>6} {'rows':>4} {'active':>11} "
+             f"{'loss':>7} {'full loss':>9} {'max util':>8}"]
+    for r in results:
+        lines.append(f"{r['matrix']:<13} {r['load']:>5.2f} {r['planes']:>6} {r['rows']:>4} "
+                     f"{r['active']:>5}/{r['switches']:<5} {r['loss'] * 100:>6.1f}% "
+                     f"{r['full_loss'] * 100:>8.1f}% {r['max_util']:>8.2f}")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Active switches vs throughput loss under consolidation.')
+    add_tier_arguments(parser)
+    parser.add_argument('--loads', type=float, nargs='+', default=[0.1, 0.25, 0.5, 1.0],
+                        help='Offered load per host (fraction of the NIC rate)')
+    parser.add_argument('--headroom', type=float, default=DEFAULT_HEADROOM)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(format_results(run(model_from_args(args), args.loads, args.headroom, args.seed)))
@@ -0,0 +1,135 @@
+# Live fabric expansion demo: add pods to a running Mininet fat-tree
+#
+# 1. 以 --pods P0 --max-pods M 启动拓扑 (core DPID 为 M 个 pod 预留编号)
+# 2. 写出扩容后的模型 (--grow-to P1)，控制器 ($FAT_TREE_MODEL_WATCH) 重新加载后
+#    只向已有交换机下发增量 (core 的新 pod 下行、广播树新端口等)
+# 3. 在运行中的网络里加入新 pod 的交换机/主机/链路，core 上直接加端口
+# 4. 测量从写出新模型到新旧主机互相 ping 通的时间，并列出流表项数变化的已有交换机
+# 控制器日志里的 "Expansion ... programmed" 给出增量和新交换机各自的消息数。
+#
+# Usage:
+#   terminalB: python3 fat_tree_model.py --k 4 --pods 2 --max-pods 4
+#   terminalA: FAT_TREE_MODEL_WATCH=0.5 ryu-manager fat_tree_routing.py
+#   terminalB: sudo python3 fat_tree_expand.py --k 4 --pods 2 --max-pods 4 --grow-to 4
+import re
+import time
+
+from mininet.net import Mininet
+from mininet.link import TCLink
+from mininet.node import RemoteController
+from mininet.cli import CLI
+
+from fat_tree_model import DEFAULT_MODEL_PATH, add_tier_arguments, make_dpid, model_from_args
+from fat_tree_topology2 import FatTreeTopo
+
+
+def flow_counts(switches):
+    counts = {}
+    for sw in switches:
+        out = sw.cmd(f'ovs-ofctl -O OpenFlow13 dump-aggregate {sw.name}')
+        m = re.search(r'flow_count=(\d+)', out)
+        counts[sw.name] = int(m.group(1)) if m else 0
+    return counts
+
+
+def add_pods(net, old, new):
+    """Add the switches, hosts and links of ``new`` that ``old`` does not have."""
+    shift = new.n_switches - old.n_switches
+
+    def is_new(node):
+        if node < new.n_switches:
+            return node >= old.n_switches
+        return new.host(node).pod >= old.pods
+
+    nodes = {}
+    for sw in new.switches[:old.n_switches]:
+        nodes[sw.index] = net.get(sw.name)
+    for host in old.hosts():
+        nodes[host.index + shift] = net.get(host.name)
+    added_switches, added_hosts = [], []
+    for sw in new.switches[old.n_switches:]:
+        nodes[sw.index] = net.addSwitch(sw.name, dpid=make_dpid(format(sw.dpid, 'x')),
+                                        protocols='OpenFlow13')
+        added_switches.append(nodes[sw.index])
+    for host in new.hosts():
+        if host.pod >= old.pods:
+            nodes[host.index] = net.addHost(host.name, ip=host.ip)
+            added_hosts.append(nodes[host.index])
+
+    for node1, port1, node2, port2 in new.links():
+        if not (is_new(node1) or is_new(node2)):
+            continue
+        link = net.addLink(nodes[node1], nodes[node2], port1=port1, port2=port2)
+        # 已在运行的交换机 (core) 需要把新接口挂上去；attach() 不带 ofport_request，
+        # 端口号必须与模型一致
+        for node, port, intf in ((node1, port1, link.intf1), (node2, port2, link.intf2)):
+            if node < new.n_switches and not is_new(node):
+                nodes[node].vsctl('add-port', nodes[node], intf,
+                                  '--', 'set', 'Interface', intf, f'ofport_request={port}')
+                intf.ifconfig('up')
+
+    for host in added_hosts:
+        host.configDefault()
+    for sw in added_switches:
+        sw.start(net.controllers)
+    net.staticArp()
+    return added_switches, added_hosts
+
+
+def wait_reachable(src, dst, t0, timeout):
+    """Seconds from ``t0`` until ``src`` can ping ``dst`` (None on timeout)."""
+    while time.perf_counter() - t0 < timeout:
+        if ' 0% packet loss' in src.cmd(f'ping -c1 -W1 {dst.IP()}'):
+            return time.perf_counter() - t0
+    return None
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Grow a running fat-tree by adding pods.')
+    add_tier_arguments(parser)
+    parser.add_argument('--grow-to', type=int, required=True, help='Pods after the expansion')
+    parser.add_argument('--model-out', default=DEFAULT_MODEL_PATH,
+                        help='Model file watched by the controller')
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--cli', action='store_true', help='Open the Mininet CLI at the end')
+    args = parser.parse_args()
+
+    old = model_from_args(args)
+    new = old.expand(args.grow_to)
+    old.save(args.model_out)
+    print(f"Fabric: {old.describe()} -> {new.describe()}")
+
+    net = Mininet(topo=FatTreeTopo(model=old), link=TCLink, controller=None,
+                  autoSetMacs=True, autoStaticArp=True)
+    net.addController('controller', controller=RemoteController,
+                      ip='127.0.0.1', port=6633, protocols='OpenFlow13')
+    net.start()
+    net.waitConnected()
+    net.pingAll()
+
+    existing = [net.get(sw.name) for sw in old.switches]
+    before = flow_counts(existing)
+
+    t0 = time.perf_counter()
+    new.save(args.model_out)
+    added_switches, added_hosts = add_pods(net, old, new)
+    old_host = net.get(next(old.hosts()).name)
+    for host in (added_hosts[0], added_hosts[-1]):
+        for src, dst in ((host, old_host), (old_host, host)):
+            elapsed = wait_reachable(src, dst, t0, args.timeout)
+            result = f"{elapsed * 1e3:.0f} ms" if elapsed is not None else "unreachable"
+            print(f"time-to-reachability {src.name} -> {dst.name}: {result}")
+
+    after = flow_counts(existing)
+    changed = {name: after[name] - before[name] for name in before if after[name] != before[name]}
+    print(f"existing switches with new flow entries: {len(changed)}/{len(existing)}")
+    for name, delta in sorted(changed.items()):
+        print(f"  {name:<10} +{delta}")
+    new_counts = flow_counts(added_switches)
+    print(f"new switches: {len(added_switches)}, flow entries {sum(new_counts.values())}")
+
+    if args.cli:
+        CLI(net)
+    net.stop()
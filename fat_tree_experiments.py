@@ -0,0 +1,254 @@
+# Experiment runner: one Mininet fat-tree per k, controller configurations swapped in place
+#
+# 每个 k 只建一次 Mininet 网络，对每种控制器配置:
+#   1. 停掉上一个 ryu-manager，清空所有交换机的流表/组表，删掉控制器建的 (带 owner 标签的) QoS
+#      (OVS 为 secure fail-mode，控制器断开后旧规则仍在)
+#   2. 用该配置的环境变量启动 ryu-manager fat_tree_routing.py
+#   3. 等所有交换机重新连上、流表项数不再变化、跨 pod 能 ping 通 (记为 program_s)
+#   4. 依次跑工作负载: fat_tree_uplinks.default_matrices 里的流量矩阵 (iperf 吞吐)，
+#      以及 mice (bench_mice_latency 的 elephant 负载下短 RPC 延迟)
+# 所有结果写进一个报告 (.json 或 .csv，按扩展名)。
+# Ryu 不能在运行中替换应用，"切换" 是重启控制器进程；省下的是 Mininet 的建网时间。
+#
+# Usage (不需要另开控制器终端):
+#   sudo python3 fat_tree_experiments.py --k 4 8 --modes ip label qos \
+#       --patterns stride_pod random0 mice --duration 10 --out report.csv
+import csv
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+from functools import partial
+
+from bench_mice_latency import RPC_PORT, clear_qos, run as run_mice
+from fat_tree_model import DEFAULT_MODEL_PATH, FatTreeModel
+from fat_tree_uplinks import default_matrices
+
+CONTROLLER_PORT = 6633
+IPERF_PORT = 5201
+
+# 配置名 -> 控制器环境变量；--env 的值叠加到每个配置上
+CONFIGS = {
+    'ip': {},
+    'label': {'FAT_TREE_ROUTING_MODE': 'label'},
+    'qos': {'FAT_TREE_QOS': '1', 'FAT_TREE_MICE_PORTS': str(RPC_PORT)},
+    'label+qos': {'FAT_TREE_ROUTING_MODE': 'label', 'FAT_TREE_QOS': '1',
+                  'FAT_TREE_MICE_PORTS': str(RPC_PORT)},
+    'elastic': {'FAT_TREE_ELASTIC': '2'},
+}
+
+
+def parse_env(pairs):
+    """['KEY=VALUE', ...] -> dict."""
+    env = {}
+    for pair in pairs:
+        key, sep, value = pair.partition('=')
+        if not sep:
+            raise ValueError(f"--env expects KEY=VALUE, got {pair!r}")
+        env[key] = value
+    return env
+
+
+# === Controller lifecycle ===
+
+def start_controller(env, log):
+    """ryu-manager fat_tree_routing.py with ``env`` added to our environment."""
+    app = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fat_tree_routing.py')
+    return subprocess.Popen(['ryu-manager', '--ofp-tcp-listen-port', str(CONTROLLER_PORT), app],
+                            env={**os.environ, **env}, stdout=log, stderr=subprocess.STDOUT)
+
+
+def stop_controller(proc, timeout=10):
+    if proc is None or proc.poll() is not None:
+        return
+    proc.terminate()
+    try:
+        proc.wait(timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def reset_switches(net, model):
+    """Drop every flow and group and the controller's tagged QoS so the next controller starts clean."""
+    for sw in net.switches:
+        sw.cmd(f'ovs-ofctl -O OpenFlow13 del-flows {sw.name}')
+        sw.cmd(f'ovs-ofctl -O OpenFlow13 del-groups {sw.name}')
+    clear_qos(model)
+
+
+def flow_total(net):
+    total = 0
+    for sw in net.switches:
+        m = re.search(r'flow_count=(\d+)', sw.cmd(f'ovs-ofctl -O OpenFlow13 dump-aggregate {sw.name}'))
+        total += int(m.group(1)) if m else 0
+    return total
+
+
+def wait_programmed(net, probe, timeout, poll=0.5):
+    """(seconds until every switch is connected, flows are stable and ``probe`` pings; flow total).
+
+    Seconds is None on timeout.
+    """
+    t0 = time.perf_counter()
+    last = -1
+    src, dst = probe
+    while time.perf_counter() - t0 < timeout:
+        time.sleep(poll)
+        if not all(sw.connected() for sw in net.switches):
+            continue
+        flows = flow_total(net)
+        if flows != last:
+            last = flows
+            continue
+        if ' 0% packet loss' in src.cmd(f'ping -c1 -W1 {dst.IP()}'):
+            return time.perf_counter() - t0, flows
+    return None, last
+
+
+# === Workloads ===
+
+def sample_flows(matrix, max_flows, seed=0):
+    flows = [(s, d) for s, d in matrix if s != d]
+    if len(flows) > max_flows:
+        flows = random.Random(seed).sample(flows, max_flows)
+    return flows
+
+
+def run_matrix(net, model, matrix, duration, max_flows, seed=0):
+    """Aggregate / per-flow iperf throughput (Mbit/s) of a host-index matrix."""
+    hosts = [net.get(h.name) for h in model.hosts()]
+    flows = sample_flows(matrix, max_flows, seed)
+    servers = [hosts[d].popen(['iperf', '-s', '-p', str(IPERF_PORT)]) for d in sorted({d for _, d in flows})]
+    time.sleep(1)
+    clients = [hosts[s].popen(['iperf', '-c', hosts[d].IP(), '-p', str(IPERF_PORT), '-t', str(duration),
+                               '-y', 'C'], universal_newlines=True)
+               for s, d in flows]
+    rates = []
+    for proc in clients:
+        out, _ = proc.communicate()
+        lines = out.strip().splitlines()
+        # iperf -y C 的最后一个字段是 bits/s；连接失败时没有输出
+        rates.append(int(lines[-1].split(',')[-1]) / 1e6 if lines else None)
+    for proc in servers:
+        proc.terminate()
+        proc.wait()
+
+    done = [r for r in rates if r is not None]
+    return {
+        'flows': len(flows),
+        'failed': len(flows) - len(done),
+        'total_mbps': sum(done),
+        'mean_mbps': sum(done) / len(done) if done else None,
+        'min_mbps': min(done, default=None),
+    }
+
+
+def run_workload(net, model, name, args):
+    if name == 'mice':
+        return run_mice(net, model, args.elephants, args.duration)
+    return run_matrix(net, model, default_matrices(model, args.seed)[name], args.duration,
+                      args.max_flows, args.seed)
+
+
+# === Sweep ===
+
+def sweep_k(model, args, log):
+    """Rows for every (mode, workload) on one Mininet network built for ``model``."""
+    from mininet.net import Mininet
+    from mininet.link import TCLink
+    from mininet.node import RemoteController
+    from fat_tree_topology2 import FatTreeTopo
+
+    model.save(args.model_out)
+    link = partial(TCLink, bw=args.bw) if args.bw else TCLink
+    t0 = time.perf_counter()
+    net = Mininet(topo=FatTreeTopo(model=model), link=link, controller=None,
+                  autoSetMacs=True, autoStaticArp=True)
+    net.addController('controller', controller=RemoteController,
+                      ip='127.0.0.1', port=CONTROLLER_PORT, protocols='OpenFlow13')
+    net.start()
+    for sw in net.switches:
+        # 控制器重启后尽快重连 (OVS 默认退避到 8 秒)
+        sw.vsctl('set', 'controller', sw.name, 'max_backoff=1000')
+    build_s = time.perf_counter() - t0
+    print(f"{model.describe()}: Mininet up in {build_s:.1f} s")
+
+    hosts = list(model.hosts())
+    probe = (net.get(hosts[0].name), net.get(hosts[-1].name))
+    extra = parse_env(args.env)
+    if args.bw:
+        extra.setdefault('FAT_TREE_LINK_MBPS', str(args.bw))
+    rows = []
+    controller = None
+    try:
+        for mode in args.modes:
+            stop_controller(controller)
+            reset_switches(net, model)
+            env = {**CONFIGS[mode], **extra, 'FAT_TREE_MODEL': os.path.abspath(args.model_out)}
+            controller = start_controller(env, log)
+            program_s, flows = wait_programmed(net, probe, args.timeout)
+            base = {'fabric': model.describe(), 'k': model.k, 'mode': mode, 'build_s': build_s,
+                    'program_s': program_s, 'flow_entries': flows}
+            if program_s is None:
+                print(f"  {mode}: not programmed within {args.timeout:.0f} s, skipped")
+                rows.append({**base, 'workload': None})
+                continue
+            print(f"  {mode}: programmed in {program_s:.1f} s ({flows} flow entries)")
+            for name in args.patterns:
+                result = run_workload(net, model, name, args)
+                print(f"    {name}: {result}")
+                rows.append({**base, 'workload': name, **result})
+    finally:
+        stop_controller(controller)
+        reset_switches(net, model)
+        net.stop()
+    return rows
+
+
+def write_report(rows, path):
+    if path.endswith('.csv'):
+        fields = list(dict.fromkeys(key for row in rows for key in row))
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fields)
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        with open(path, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Sweep k, controller mode and workload on persistent topologies.')
+    parser.add_argument('--k', type=int, nargs='+', default=[4], help='One Mininet network per k')
+    parser.add_argument('--modes', nargs='+', default=['ip', 'label'], choices=sorted(CONFIGS))
+    parser.add_argument('--env', nargs='*', default=[], metavar='KEY=VALUE',
+                        help='Extra controller environment for every mode')
+    parser.add_argument('--patterns', nargs='+', default=['stride_pod', 'random0'],
+                        help="Traffic matrices of fat_tree_uplinks.default_matrices, or 'mice'")
+    parser.add_argument('--duration', type=int, default=10, help='iperf seconds per workload')
+    parser.add_argument('--max-flows', type=int, default=64, help='Sample larger matrices down to this many flows')
+    parser.add_argument('--elephants', type=int, default=2, help="Elephant flows of the 'mice' workload")
+    parser.add_argument('--bw', type=float, default=None, help='TCLink rate in Mbit/s (also FAT_TREE_LINK_MBPS)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=60.0, help='Seconds to wait for reprogramming')
+    parser.add_argument('--model-out', default=DEFAULT_MODEL_PATH, help='Model file handed to the controller')
+    parser.add_argument('--controller-log', default='experiments_controller.log')
+    parser.add_argument('--out', default='experiments.json', help='Report (.json or .csv)')
+    args = parser.parse_args()
+
+    rows = []
+    with open(args.controller_log, 'a') as log:
+        for k in args.k:
+            model = FatTreeModel(k)
+            unknown = [p for p in args.patterns if p != 'mice' and p not in default_matrices(model, args.seed)]
+            if unknown:
+                sys.exit(f"unknown patterns: {', '.join(unknown)}")
+            rows.extend(sweep_k(model, args, log))
+            write_report(rows, args.out)        # 每个 k 跑完就写一次，中途失败也有结果
+    print(f"{len(rows)} rows -> {args.out}")
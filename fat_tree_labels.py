@@ -0,0 +1,65 @@
+# VLAN label source routing for the fat-tree ($FAT_TREE_ROUTING_MODE=label)
+#
+# ingress edge 按目的主机选好路径 (agg plane 由出端口决定，core row 写进标签)，
+# push VLAN，vid = [row | dst pod | dst edge]；之后各层只看标签:
+#   agg_p_a  : 标签 pod == p -> 下行到标签里的 edge (E 条)，否则上行到标签里的 row (C 条)
+#   core_j_a : 标签 pod -> 对应端口 (P 条)
+#   edge     : 带标签的包 pop VLAN 后按 /32 交给本地主机 (H 条)
+# agg/core 的表只与端口数有关，与地址规划和上行分流表无关；改一条流的路径只需
+# 改 ingress edge 上的一条规则 (IP 模式要先改源 pod 的 agg，再改 edge)。
+#
+# 用 VLAN 而不是 MPLS: OF1.3 的 vlan_vid 可以带掩码匹配，mpls_label 不行；按字段
+# 掩码匹配才能让 agg/core 的表保持 O(端口数)。vid 只有 12 位，要求
+# bits(row) + bits(max_pods) + bits(edge) <= 12 (fat-tree 时 k <= 16)。
+VID_PRESENT = 0x1000        # ofproto_v1_3.OFPVID_PRESENT
+VID_BITS = 12
+
+ROUTING_MODES = ('ip', 'label')
+
+
+def _bits(n):
+    return max(n - 1, 0).bit_length()
+
+
+class LabelPlan:
+    """Bit layout of the path label carried in the VLAN id."""
+
+    def __init__(self, model):
+        self.edge_bits = _bits(model.edges)
+        self.pod_bits = _bits(model.max_pods)     # 留出在线扩容的 pod，扩容时标签格式不变
+        self.row_bits = _bits(model.core_rows)
+        total = self.edge_bits + self.pod_bits + self.row_bits
+        if total > VID_BITS:
+            raise ValueError(f"path label needs {total} bits for {model.tiers}, "
+                             f"the VLAN id has {VID_BITS}")
+        self.pod_shift = self.edge_bits
+        self.row_shift = self.edge_bits + self.pod_bits
+
+    def encode(self, pod, edge, row=0):
+        """vlan_vid (with OFPVID_PRESENT) for a path to (pod, edge) via core ``row``."""
+        return VID_PRESENT | row << self.row_shift | pod << self.pod_shift | edge
+
+    def decode(self, vid):
+        """(pod, edge, row) of a vlan_vid."""
+        return ((vid >> self.pod_shift) & ((1 << self.pod_bits) - 1),
+                vid & ((1 << self.edge_bits) - 1),
+                (vid >> self.row_shift) & ((1 << self.row_bits) - 1))
+
+    def match(self, pod=None, edge=None, row=None):
+        """(vlan_vid, mask) matching only the given label fields."""
+        value = mask = VID_PRESENT
+        for field, shift, bits in ((pod, self.pod_shift, self.pod_bits),
+                                   (edge, 0, self.edge_bits),
+                                   (row, self.row_shift, self.row_bits)):
+            if field is not None:
+                value |= field << shift
+                mask |= ((1 << bits) - 1) << shift
+        return value, mask
+
+
+def path_label(plan, uplinks, src_pod, src_edge, dst):
+    """(uplink agg, vlan_vid) chosen by the uplink table for edge (src_pod, src_edge) -> Host ``dst``."""
+    key = uplinks.key_of(dst.pod, dst.edge, dst.slot)
+    agg = uplinks.edge_uplink(src_pod, src_edge, key)
+    row = uplinks.agg_uplink(src_pod, agg, key) if dst.pod != src_pod else 0
+    return agg, plan.encode(dst.pod, dst.edge, row)
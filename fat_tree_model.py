@@ -0,0 +1,488 @@
+# Shared Fat-Tree model: address plan, DPID encoding and port wiring (k-ary fat-tree)
+#
+# 拓扑脚本 (fat_tree_topology*.py) 和控制器 (fat_tree_routing*.py) 都从这里取
+# 交换机/主机/端口信息，避免两边各自"猜"对方的编号规则。
+#
+# 除标准 k-ary fat-tree 外也支持一般化的三层 Clos (每层数量/端口数可不同):
+#   pods       P  pod 数 (fat-tree: k)
+#   edges      E  每个 pod 的 edge 交换机数 (k/2)
+#   aggs       A  每个 pod 的 agg 交换机数 (k/2)
+#   hosts      H  每台 edge 下的主机数 (k/2)
+#   core_rows  C  每个 agg 平面的 core 数 = 每台 agg 的上行数 (k/2)
+# edge 超额订阅比 = H:A，agg 超额订阅比 = E:C。
+# max_pods M 为 core 可接入的 pod 上限；M > P 时可用 expand() 在线增加 pod，
+# 已有交换机的编号、DPID 和端口都不变。
+#
+# Wiring (all ports start at 1):
+#   edge_p_e : hosts on 1..H, agg_p_a on H + a + 1
+#   agg_p_a  : edge_p_e on e + 1, core row j on E + j + 1
+#   core_j_i : agg_p_(i-1) of every pod p on p + 1
+#
+# DPID encoding (hex bytes):
+#   core_j_i : M  j  i       (j, i from 1; M = max_pods, default P)
+#   agg_p_a  : p  a+E  01
+#   edge_p_e : p  e  01
+import json
+import os
+import struct
+import tempfile
+from array import array
+
+ROLE_CORE = 0
+ROLE_AGG = 1
+ROLE_EDGE = 2
+ROLE_NAMES = ('core', 'agg', 'edge')
+
+DEFAULT_MODEL_PATH = 'fat_tree_model.json'
+MODEL_FORMAT = 'fat-tree-model'
+MODEL_VERSION = 2
+_BIN_MAGIC = b'FTM2'
+_BIN_HEADER = struct.Struct('<4s5HII')  # magic, P, E, A, H, C, n_switches, n_hosts
+
+NO_PEER = -1
+
+
+def make_dpid(hexstr: str) -> str:
+    return hexstr.zfill(16)
+
+
+def ip_to_int(ip: str) -> int:
+    a, b, c, d = (int(x) for x in ip.split('.'))
+    return (a << 24) | (b << 16) | (c << 8) | d
+
+
+def int_to_ip(value: int) -> str:
+    return f'{value >> 24 & 0xff}.{value >> 16 & 0xff}.{value >> 8 & 0xff}.{value & 0xff}'
+
+
+class Switch:
+    __slots__ = ('index', 'dpid', 'role', 'pod', 'position')
+
+    def __init__(self, index, dpid, role, pod, position):
+        self.index = index
+        self.dpid = dpid
+        self.role = role          # ROLE_CORE / ROLE_AGG / ROLE_EDGE
+        self.pod = pod            # core: row j (0-based)
+        self.position = position  # core: column i (0-based)
+
+    @property
+    def role_name(self):
+        return ROLE_NAMES[self.role]
+
+    @property
+    def name(self):
+        if self.role == ROLE_CORE:
+            return f'core_{self.pod + 1}_{self.position + 1}'
+        return f'{ROLE_NAMES[self.role]}_{self.pod}_{self.position}'
+
+    @property
+    def dpid_str(self):
+        return format(self.dpid, '016x')
+
+    def __repr__(self):
+        return f'Switch({self.name}, dpid={self.dpid_str})'
+
+
+class Host:
+    __slots__ = ('index', 'pod', 'edge', 'slot')
+
+    def __init__(self, index, pod, edge, slot):
+        self.index = index
+        self.pod = pod
+        self.edge = edge
+        self.slot = slot          # 0-based host number on the edge switch
+
+    @property
+    def name(self):
+        return f'h{self.pod}_{self.edge}_{self.slot}'
+
+    @property
+    def ip(self):
+        return f'10.{self.pod}.{self.edge}.{self.slot + 2}'
+
+    @property
+    def port(self):
+        return self.slot + 1      # port on the edge switch
+
+    def __repr__(self):
+        return f'Host({self.name}, ip={self.ip})'
+
+
+class FatTreeModel:
+    """Array-backed fat-tree / three-tier Clos.
+
+    ``FatTreeModel(k)`` is the k-ary fat-tree; the keyword arguments override
+    individual tiers. ``k`` is kept as the pod count (the core DPID byte).
+
+    Nodes are numbered globally: switches first (core, then per pod agg and
+    edge), hosts after them. ``peer_node``/``peer_port`` are flat arrays indexed
+    by ``switch_index * (max_ports + 1) + port``.
+    """
+
+    def __init__(self, k=4, pods=None, edges=None, aggs=None, hosts=None, core_rows=None,
+                 max_pods=None, dpids=None, roles=None, pods_arr=None, positions=None,
+                 peer_node=None, peer_port=None):
+        if pods is None and edges is None and aggs is None and hosts is None \
+                and core_rows is None and k % 2 != 0:
+            raise ValueError("k must be even")
+        half = k // 2
+        self.pods = k if pods is None else pods
+        self.edges = half if edges is None else edges
+        self.aggs = half if aggs is None else aggs
+        self.hosts_per_edge = half if hosts is None else hosts
+        self.core_rows = half if core_rows is None else core_rows
+        if min(self.pods, self.edges, self.aggs, self.hosts_per_edge, self.core_rows) < 1:
+            raise ValueError("every tier needs at least one switch/host")
+        if self.pods > 0xfe or self.edges + self.aggs > 0xff \
+                or self.core_rows > 0xff or self.aggs > 0xff:
+            raise ValueError("tier sizes must fit in one DPID byte")
+        if self.edges > 0xff or self.hosts_per_edge > 0xfc:
+            raise ValueError("tier sizes must fit the 10.pod.edge.host address plan")
+        # core DPID 首字节必须大于所有 pod 编号，否则会与 agg/edge 的 DPID 冲突
+        self._max_pods = self.pods if max_pods is None else max_pods
+        if not self.pods <= self._max_pods <= 0xfe:
+            raise ValueError(f"max_pods must be between pods ({self.pods}) and 254")
+
+        self.k = self.pods
+        self.n_core = self.core_rows * self.aggs
+        self.pod_size = self.aggs + self.edges
+        self.n_switches = self.n_core + self.pods * self.pod_size
+        self.n_hosts = self.pods * self.edges * self.hosts_per_edge
+        self.max_ports = max(self.hosts_per_edge + self.aggs, self.edges + self.core_rows, self.pods)
+        self.stride = self.max_ports + 1
+
+        if dpids is None:
+            self._build()
+        else:
+            self.dpids = dpids
+            self.roles = roles
+            self.pods_arr = pods_arr
+            self.positions = positions
+            self.peer_node = peer_node
+            self.peer_port = peer_port
+            self._check()
+        self._index_switches()
+
+    def _index_switches(self):
+        self.switches = [Switch(i, self.dpids[i], self.roles[i], self.pods_arr[i], self.positions[i])
+                         for i in range(self.n_switches)]
+        self._by_dpid = {sw.dpid: sw for sw in self.switches}
+
+    @property
+    def max_pods(self):
+        """Pods the core can take (the core DPID byte)."""
+        return self.dpids[0] >> 16
+
+    def expand(self, pods):
+        """The same fabric grown to ``pods`` pods.
+
+        New pods are appended, so every existing switch keeps its index, DPID
+        and port wiring; host node ids shift (hosts are numbered after the
+        switches) but host addresses do not.
+        """
+        if not self.pods <= pods <= self.max_pods:
+            raise ValueError(f"can grow from {self.pods} to at most max_pods={self.max_pods} pods")
+        return FatTreeModel(pods=pods, edges=self.edges, aggs=self.aggs, hosts=self.hosts_per_edge,
+                            core_rows=self.core_rows, max_pods=self.max_pods)
+
+    @property
+    def is_fat_tree(self):
+        half = self.pods // 2
+        return self.pods % 2 == 0 and \
+            (self.edges, self.aggs, self.hosts_per_edge, self.core_rows) == (half, half, half, half)
+
+    @property
+    def tiers(self):
+        return {'pods': self.pods, 'edges': self.edges, 'aggs': self.aggs,
+                'hosts': self.hosts_per_edge, 'core_rows': self.core_rows}
+
+    @property
+    def oversubscription(self):
+        """(edge H:A, agg E:C) ratios; 1.0 means full bisection."""
+        return self.hosts_per_edge / self.aggs, self.edges / self.core_rows
+
+    def describe(self):
+        growth = f' max_pods={self.max_pods}' if self.max_pods != self.pods else ''
+        if self.is_fat_tree:
+            return f'k={self.k}{growth}'
+        edge_os, agg_os = self.oversubscription
+        return (f'pods={self.pods} edges={self.edges} aggs={self.aggs} '
+                f'hosts={self.hosts_per_edge} core_rows={self.core_rows}{growth} '
+                f'(oversub edge {edge_os:g}:1, agg {agg_os:g}:1)')
+
+    # === Index arithmetic ===
+    def core_index(self, row, col):
+        return row * self.aggs + col
+
+    def agg_index(self, pod, agg):
+        return self.n_core + pod * self.pod_size + agg
+
+    def edge_index(self, pod, edge):
+        return self.n_core + pod * self.pod_size + self.aggs + edge
+
+    def host_node(self, pod, edge, slot):
+        return self.n_switches + (pod * self.edges + edge) * self.hosts_per_edge + slot
+
+    def _build(self):
+        P, E, A, H, C = self.pods, self.edges, self.aggs, self.hosts_per_edge, self.core_rows
+        n, stride = self.n_switches, self.stride
+        self.dpids = array('Q', bytes(8 * n))
+        self.roles = array('B', bytes(n))
+        self.pods_arr = array('H', bytes(2 * n))
+        self.positions = array('H', bytes(2 * n))
+        self.peer_node = array('i', [NO_PEER]) * (n * stride)
+        self.peer_port = array('H', bytes(2 * n * stride))
+
+        for j in range(C):
+            for i in range(A):
+                idx = self.core_index(j, i)
+                self.dpids[idx] = (self._max_pods << 16) | ((j + 1) << 8) | (i + 1)
+                self.roles[idx] = ROLE_CORE
+                self.pods_arr[idx] = j
+                self.positions[idx] = i
+
+        for pod in range(P):
+            for a in range(A):
+                idx = self.agg_index(pod, a)
+                self.dpids[idx] = (pod << 16) | ((a + E) << 8) | 0x01
+                self.roles[idx] = ROLE_AGG
+                self.pods_arr[idx] = pod
+                self.positions[idx] = a
+            for e in range(E):
+                idx = self.edge_index(pod, e)
+                self.dpids[idx] = (pod << 16) | (e << 8) | 0x01
+                self.roles[idx] = ROLE_EDGE
+                self.pods_arr[idx] = pod
+                self.positions[idx] = e
+
+                # Hosts: edge port h+1 (host side port 0)
+                for h in range(H):
+                    self._wire(idx, h + 1, self.host_node(pod, e, h), 0)
+
+            # Edge <-> Agg intra-pod links
+            for a in range(A):
+                for e in range(E):
+                    self._wire(self.agg_index(pod, a), e + 1,
+                               self.edge_index(pod, e), H + a + 1)
+
+        # Core <-> Agg inter-pod links
+        for i in range(A):
+            for j in range(C):
+                core = self.core_index(j, i)
+                for pod in range(P):
+                    self._wire(core, pod + 1, self.agg_index(pod, i), E + j + 1)
+
+    def _wire(self, sw, port, peer, peer_port):
+        slot = sw * self.stride + port
+        self.peer_node[slot] = peer
+        self.peer_port[slot] = peer_port
+        if peer < self.n_switches:
+            slot = peer * self.stride + peer_port
+            self.peer_node[slot] = sw
+            self.peer_port[slot] = port
+
+    def _check(self):
+        n = self.n_switches
+        if n and self.dpids[0] >> 16 < self.pods:
+            raise ValueError(f"core DPIDs leave no room for {self.pods} pods")
+        sizes = (len(self.dpids), len(self.roles), len(self.pods_arr), len(self.positions))
+        if sizes != (n, n, n, n) or len(self.peer_node) != n * self.stride \
+                or len(self.peer_port) != n * self.stride:
+            raise ValueError(f"model arrays do not match {self.describe()}")
+
+    # === Lookups (O(1)) ===
+    def switch_by_dpid(self, dpid):
+        return self._by_dpid.get(dpid)
+
+    def identify(self, dpid):
+        """Return (role_name, (pod, position)) for a DPID, or (None, None)."""
+        sw = self._by_dpid.get(dpid)
+        if sw is None:
+            return None, None
+        return ROLE_NAMES[sw.role], (sw.pod, sw.position)
+
+    def host(self, node):
+        rel = node - self.n_switches
+        if rel < 0 or rel >= self.n_hosts:
+            return None
+        edge_no, slot = divmod(rel, self.hosts_per_edge)
+        pod, edge = divmod(edge_no, self.edges)
+        return Host(node, pod, edge, slot)
+
+    def host_by_ip(self, ip):
+        value = ip_to_int(ip) if isinstance(ip, str) else ip
+        a, pod, edge, last = value >> 24 & 0xff, value >> 16 & 0xff, value >> 8 & 0xff, value & 0xff
+        slot = last - 2
+        if a != 10 or pod >= self.pods or edge >= self.edges or not 0 <= slot < self.hosts_per_edge:
+            return None
+        return Host(self.host_node(pod, edge, slot), pod, edge, slot)
+
+    def hosts(self):
+        for node in range(self.n_switches, self.n_switches + self.n_hosts):
+            yield self.host(node)
+
+    def peer(self, sw, port):
+        """Return (peer_node, peer_port) behind ``port`` of switch index ``sw``."""
+        slot = sw * self.stride + port
+        return self.peer_node[slot], self.peer_port[slot]
+
+    def node_name(self, node):
+        if node < self.n_switches:
+            return self.switches[node].name
+        return self.host(node).name
+
+    def links(self):
+        """Yield each link once as (node1, port1, node2, port2), switch side first."""
+        stride = self.stride
+        for sw in range(self.n_switches):
+            base = sw * stride
+            for port in range(1, stride):
+                peer = self.peer_node[base + port]
+                if peer == NO_PEER:
+                    continue
+                if peer >= self.n_switches or peer > sw:
+                    yield sw, port, peer, self.peer_port[base + port]
+
+    # === Serialization ===
+    def to_dict(self):
+        return {
+            'format': MODEL_FORMAT,
+            'version': MODEL_VERSION,
+            'tiers': self.tiers,
+            'dpids': list(self.dpids),
+            'roles': list(self.roles),
+            'pods': list(self.pods_arr),
+            'positions': list(self.positions),
+            'peer_node': list(self.peer_node),
+            'peer_port': list(self.peer_port),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('format') != MODEL_FORMAT or data.get('version') != MODEL_VERSION:
+            raise ValueError("not a fat-tree model artifact")
+        return cls(**data['tiers'],
+                   dpids=array('Q', data['dpids']),
+                   roles=array('B', data['roles']),
+                   pods_arr=array('H', data['pods']),
+                   positions=array('H', data['positions']),
+                   peer_node=array('i', data['peer_node']),
+                   peer_port=array('H', data['peer_port']))
+
+    def to_bytes(self):
+        header = _BIN_HEADER.pack(_BIN_MAGIC, self.pods, self.edges, self.aggs,
+                                  self.hosts_per_edge, self.core_rows,
+                                  self.n_switches, self.n_hosts)
+        return b''.join((header, self.dpids.tobytes(), self.roles.tobytes(),
+                         self.pods_arr.tobytes(), self.positions.tobytes(),
+                         self.peer_node.tobytes(), self.peer_port.tobytes()))
+
+    @classmethod
+    def from_bytes(cls, blob):
+        if len(blob) < _BIN_HEADER.size:
+            raise ValueError("truncated fat-tree model artifact")
+        magic, P, E, A, H, C, n_switches, _ = _BIN_HEADER.unpack_from(blob, 0)
+        if magic != _BIN_MAGIC:
+            raise ValueError("not a fat-tree model artifact")
+        stride = max(H + A, E + C, P) + 1
+        offset = _BIN_HEADER.size
+        arrays = []
+        for typecode, count in (('Q', n_switches), ('B', n_switches), ('H', n_switches),
+                                ('H', n_switches), ('i', n_switches * stride),
+                                ('H', n_switches * stride)):
+            arr = array(typecode)
+            end = offset + arr.itemsize * count
+            if end > len(blob):
+                raise ValueError("truncated fat-tree model artifact")
+            arr.frombytes(blob[offset:end])
+            arrays.append(arr)
+            offset = end
+        return cls(pods=P, edges=E, aggs=A, hosts=H, core_rows=C, dpids=arrays[0], roles=arrays[1],
+                   pods_arr=arrays[2], positions=arrays[3], peer_node=arrays[4], peer_port=arrays[5])
+
+    def save(self, path=DEFAULT_MODEL_PATH):
+        """Write a .json artifact, or the binary form for any other extension.
+
+        Written to a temporary file in the same directory and renamed over
+        ``path``, so a controller watching the file never reads half of it.
+        """
+        if path.endswith('.json'):
+            data = json.dumps(self.to_dict(), separators=(',', ':')).encode()
+        else:
+            data = self.to_bytes()
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            # mkstemp 建的是 0600；与 open() 一样按 umask 给权限 (控制器可能以别的用户运行)
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp, 0o666 & ~umask)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    @classmethod
+    def load(cls, path=DEFAULT_MODEL_PATH):
+        if path.endswith('.json'):
+            with open(path) as f:
+                return cls.from_dict(json.load(f))
+        with open(path, 'rb') as f:
+            return cls.from_bytes(f.read())
+
+
+def add_tier_arguments(parser):
+    """--k plus optional per-tier overrides, shared by the command line scripts."""
+    parser.add_argument('--k', type=int, default=4, help='Number of ports per switch (must be even)')
+    parser.add_argument('--pods', type=int, help='Pods (default k)')
+    parser.add_argument('--edges', type=int, help='Edge switches per pod (default k/2)')
+    parser.add_argument('--aggs', type=int, help='Aggregation switches per pod (default k/2)')
+    parser.add_argument('--hosts', type=int, help='Hosts per edge switch (default k/2)')
+    parser.add_argument('--core-rows', type=int, help='Core switches per agg plane / agg uplinks (default k/2)')
+    parser.add_argument('--max-pods', type=int, help='Pods the core can grow to at runtime (default pods)')
+
+
+def model_from_args(args):
+    return FatTreeModel(args.k, pods=args.pods, edges=args.edges, aggs=args.aggs,
+                        hosts=args.hosts, core_rows=args.core_rows, max_pods=args.max_pods)
+
+
+def load_model(path=None, k=None):
+    """(model, source) used by the controller at startup.
+
+    Order: explicit path / $FAT_TREE_MODEL artifact, then explicit k /
+    $FAT_TREE_K, then k=4. ``source`` says which one was used and is None
+    for the k=4 fallback, so the caller can warn about it.
+    """
+    path = path or os.environ.get('FAT_TREE_MODEL', DEFAULT_MODEL_PATH)
+    if os.path.exists(path):
+        return FatTreeModel.load(path), f'artifact {path}'
+    if k is not None:
+        return FatTreeModel(k), f'k={k}'
+    if 'FAT_TREE_K' in os.environ:
+        k = int(os.environ['FAT_TREE_K'])
+        return FatTreeModel(k), f'$FAT_TREE_K={k}'
+    return FatTreeModel(4), None
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+    import tracemalloc
+
+    parser = argparse.ArgumentParser(description='Build a fat-tree model and write the artifact.')
+    add_tier_arguments(parser)
+    parser.add_argument('--out', default=DEFAULT_MODEL_PATH, help='.json or binary (e.g. .bin) artifact')
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    model = model_from_args(args)
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    model.save(args.out)
+    print(f"{model.describe()} switches={model.n_switches} hosts={model.n_hosts} "
+          f"build={elapsed * 1000:.1f}ms peak={peak / 1024:.0f}KiB -> {args.out}")
@@ -0,0 +1,231 @@
+# Loop-free multicast / broadcast distribution trees over the fat-tree
+#
+# 每个组选一台 core (row j, plane a) 作为根，树只用 plane a 的 agg:
+#   edge_p_e : 成员主机端口 + (组在本 edge 之外还有成员时) 上行到 agg_p_a
+#   agg_p_a  : 有成员的 edge 端口 + (组在本 pod 之外还有成员时) 上行到 core_j_a
+#   core_j_a : 有成员的 pod 端口
+# 树上的交换机安装 OFPGT_ALL 组 (桶 = 上面的端口)，交换机自动跳过入端口，
+# 所以同一个组既能向下分发也能把本地源的包送上树。不在树上的 edge/agg 只
+# 安装 "朝根" 规则 (上行到 plane a)，非成员主机也能作为源。
+#
+# 广播 (ARP 等) 用成员 = 全部主机、根 = core_1_1 的同一种树，替代原来在有环
+# 拓扑上会形成广播风暴的 OFPP_FLOOD。
+#
+# Usage (离线比较复制份数和 core 带宽):
+#   python3 fat_tree_multicast.py --k 4 --members 10.0.0.2 10.1.1.3 10.3.0.2 --src 10.2.0.2
+from fat_tree_model import ROLE_AGG, ROLE_CORE, add_tier_arguments, ip_to_int, model_from_args
+
+BROADCAST_GROUP_ID = 1
+MULTICAST_GROUP_BASE = 0x100
+MULTICAST_NET = ('224.0.0.0', '240.0.0.0')
+
+GROUP = 'group'
+OUTPUT = 'output'
+
+
+def is_multicast(ip):
+    return (ip_to_int(ip) >> 28) == 0xe
+
+
+def root_for(model, group_ip):
+    """(core row, plane) used as the root of a multicast group."""
+    return divmod(ip_to_int(group_ip) % model.n_core, model.aggs)
+
+
+def forwarding(model, members, root=(0, 0)):
+    """Per-switch forwarding for one distribution tree.
+
+    ``members`` is an iterable of host node ids. Returns
+    {switch index: (GROUP, ports)} for tree switches and
+    {switch index: (OUTPUT, port)} for the "towards the root" entries;
+    switches not listed carry no state for this tree.
+    """
+    row, plane = root
+    H, E = model.hosts_per_edge, model.edges
+    member_hosts = [model.host(node) for node in sorted(set(members))]
+    if not member_hosts:
+        return {}
+
+    edge_ports = {}
+    pods = {}
+    for h in member_hosts:
+        edge_ports.setdefault((h.pod, h.edge), []).append(h.port)
+        pods.setdefault(h.pod, set()).add(h.edge)
+    multi_pod = len(pods) > 1
+
+    table = {}
+    core = model.core_index(row, plane)
+    table[core] = (GROUP, [p + 1 for p in sorted(pods)])
+    for pod in range(model.pods):
+        agg = model.agg_index(pod, plane)
+        if pod in pods:
+            ports = [e + 1 for e in sorted(pods[pod])]
+            if multi_pod:
+                ports.append(E + row + 1)
+            table[agg] = (GROUP, ports)
+        else:
+            table[agg] = (OUTPUT, E + row + 1)
+        for e in range(E):
+            sw = model.edge_index(pod, e)
+            uplink = H + plane + 1
+            ports = edge_ports.get((pod, e))
+            if ports is None:
+                table[sw] = (OUTPUT, uplink)
+            elif len(pods) > 1 or len(pods[pod]) > 1:
+                table[sw] = (GROUP, ports + [uplink])
+            else:
+                table[sw] = (GROUP, list(ports))
+    return table
+
+
+def broadcast_forwarding(model):
+    return forwarding(model, range(model.n_switches, model.n_switches + model.n_hosts))
+
+
+class GroupMembership:
+    """IGMP-snooped membership: group ip -> set of host node ids, plus group ids."""
+
+    def __init__(self):
+        self.members = {}
+        self.group_ids = {}
+        self._next_id = MULTICAST_GROUP_BASE
+
+    def group_id(self, group_ip):
+        gid = self.group_ids.get(group_ip)
+        if gid is None:
+            gid = self.group_ids[group_ip] = self._next_id
+            self._next_id += 1
+        return gid
+
+    def join(self, group_ip, host):
+        """True if membership changed."""
+        hosts = self.members.setdefault(group_ip, set())
+        if host in hosts:
+            return False
+        hosts.add(host)
+        self.group_id(group_ip)
+        return True
+
+    def leave(self, group_ip, host):
+        hosts = self.members.get(group_ip)
+        if not hosts or host not in hosts:
+            return False
+        hosts.discard(host)
+        return True
+
+    def groups(self):
+        return list(self.members)
+
+    def remap(self, shift):
+        """Shift every member's node id (the fabric grew by ``shift`` switches)."""
+        for group_ip, hosts in self.members.items():
+            self.members[group_ip] = {host + shift for host in hosts}
+
+
+# === Offline measurement ===
+
+def _deliver(model, entries, src_node, hop_limit=None):
+    """Walk the forwarding state from one source host.
+
+    ``entries(sw)`` returns the output ports for a packet at switch ``sw``
+    (the ingress port is removed here, as the switch does). Returns
+    (link copies {(node, port): n}, host deliveries {host node: n}).
+    """
+    links = {}
+    hosts = {}
+    src = model.host(src_node)
+    frontier = [(model.edge_index(src.pod, src.edge), src.port, 0)]
+    while frontier:
+        nxt = []
+        for sw, in_port, hops in frontier:
+            if hop_limit is not None and hops >= hop_limit:
+                continue
+            for port in entries(sw):
+                if port == in_port:
+                    continue
+                links[(sw, port)] = links.get((sw, port), 0) + 1
+                peer, peer_port = model.peer(sw, port)
+                if peer >= model.n_switches:
+                    hosts[peer] = hosts.get(peer, 0) + 1
+                else:
+                    nxt.append((peer, peer_port, hops + 1))
+        frontier = nxt
+    return links, hosts
+
+
+def measure(model, members, src_node, strategy, root=(0, 0), hop_limit=6):
+    """Copies and core bandwidth for delivering one packet from ``src_node``.
+
+    strategy: 'tree' (this module), 'broadcast' (multicast sent on the
+    broadcast tree), 'unicast' (one copy per member along unicast paths,
+    approximated by per-member trees) or 'flood' (OFPP_FLOOD everywhere,
+    truncated after ``hop_limit`` switch hops because it loops).
+    """
+    members = set(members)
+    if strategy == 'flood':
+        def entries(sw):
+            return [p for p in range(1, model.stride) if model.peer(sw, p)[0] != -1]
+        links, hosts = _deliver(model, entries, src_node, hop_limit)
+    elif strategy == 'unicast':
+        links, hosts = {}, {}
+        for m in members - {src_node}:
+            table = forwarding(model, [m], root)
+            part_links, part_hosts = _deliver(model, _tree_entries(table), src_node)
+            for key, n in part_links.items():
+                links[key] = links.get(key, 0) + n
+            for key, n in part_hosts.items():
+                hosts[key] = hosts.get(key, 0) + n
+    else:
+        table = broadcast_forwarding(model) if strategy == 'broadcast' else forwarding(model, members, root)
+        links, hosts = _deliver(model, _tree_entries(table), src_node)
+
+    core_copies = sum(n for (sw, port), n in links.items() if _is_core_link(model, sw, port))
+    receivers = members - {src_node}
+    return {
+        'link_copies': sum(links.values()),
+        'core_copies': core_copies,
+        'duplicate_link_copies': sum(n - 1 for n in links.values() if n > 1),
+        'duplicate_deliveries': sum(n - 1 for n in hosts.values() if n > 1),
+        'non_member_deliveries': sum(n for h, n in hosts.items() if h not in members),
+        'members_reached': len(receivers & set(hosts)),
+        'members': len(receivers),
+    }
+
+
+def _is_core_link(model, sw, port):
+    role = model.switches[sw].role
+    return role == ROLE_CORE or (role == ROLE_AGG and model.peer(sw, port)[0] < model.n_core)
+
+
+def _tree_entries(table):
+    def entries(sw):
+        entry = table.get(sw)
+        if entry is None:
+            return []
+        kind, ports = entry
+        return ports if kind == GROUP else [ports]
+    return entries
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compare multicast delivery strategies on the fat-tree.')
+    add_tier_arguments(parser)
+    parser.add_argument('--group', default='239.1.1.1')
+    parser.add_argument('--members', nargs='+', required=True, help='Member host IPs')
+    parser.add_argument('--src', required=True, help='Sender host IP')
+    args = parser.parse_args()
+
+    model = model_from_args(args)
+    members = [model.host_by_ip(ip).index for ip in args.members]
+    src = model.host_by_ip(args.src).index
+    root = root_for(model, args.group)
+
+    print(f"{'strategy':<10} {'links':>6} {'core':>6} {'dup links':>10} {'dup recv':>9} "
+          f"{'non-member':>10} {'reached':>8}")
+    for strategy in ('tree', 'broadcast', 'unicast', 'flood'):
+        r = measure(model, members, src, strategy, root)
+        print(f"{strategy:<10} {r['link_copies']:>6} {r['core_copies']:>6} "
+              f"{r['duplicate_link_copies']:>10} {r['duplicate_deliveries']:>9} "
+              f"{r['non_member_deliveries']:>10} {r['members_reached']:>4}/{r['members']}")
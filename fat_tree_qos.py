@@ -0,0 +1,129 @@
+# Mice-flow priority queuing: OVS queues + set_queue classification ($FAT_TREE_QOS=1)
+#
+# 每个交换机端口一个 linux-htb QoS，两条队列:
+#   queue 0 (bulk) : 默认，min-rate = 链路速率 - mice 保证带宽，HTB priority 1
+#   queue 1 (mice) : 短 RPC 流，min-rate = mice 保证带宽，HTB priority 0 (优先借用空闲带宽)
+# mice 有独立的短队列，不再排在 elephant 积压的包后面。
+#
+# 分类在 table 0，路由规则移到 table 1:
+#   所有交换机 : ip_dscp ∈ $FAT_TREE_MICE_DSCP (默认 46/EF) -> set_queue(1)
+#   edge       : TCP/UDP 端口 ∈ $FAT_TREE_MICE_PORTS -> 打 DSCP 标记 + set_queue(1)
+# set_queue 只在本交换机有效，DSCP 标记让 agg/core/egress edge 继续把包放进 mice 队列。
+# OpenFlow 不能建队列，队列由控制器调用 ovs-vsctl 创建 (控制器与 OVS 在同一台机器)；
+# QoS 行带 external_ids:fat-tree-switch=<交换机名>，重连时先删掉同一交换机的旧行再建。
+# linux-htb 的 max-rate 会替换这些接口上原有的 tc 限速 (Mininet TCLink 的 bw)。
+import os
+
+from fat_tree_model import NO_PEER
+
+QUEUE_BULK = 0
+QUEUE_MICE = 1
+DEFAULT_MICE_DSCP = (46,)
+DEFAULT_MICE_SHARE = 0.1
+
+
+def parse_ports(spec):
+    """'5100,6000-6003' -> [5100, 6000, 6001, 6002, 6003]."""
+    ports = []
+    for part in filter(None, (p.strip() for p in spec.split(','))):
+        lo, _, hi = part.partition('-')
+        ports.extend(range(int(lo), int(hi or lo) + 1))
+    return ports
+
+
+class MiceClasses:
+    """Which traffic goes to the mice queue, as OFPMatch keyword sets."""
+
+    def __init__(self, dscp=DEFAULT_MICE_DSCP, ports=()):
+        self.dscp = tuple(dscp)
+        self.ports = tuple(ports)
+        self.mark = self.dscp[0]
+
+    @classmethod
+    def from_env(cls):
+        dscp = os.environ.get('FAT_TREE_MICE_DSCP')
+        dscp = tuple(int(d) for d in dscp.split(',')) if dscp else DEFAULT_MICE_DSCP
+        return cls(dscp, parse_ports(os.environ.get('FAT_TREE_MICE_PORTS', '')))
+
+    def marked(self):
+        """Matches for already-marked packets (every switch)."""
+        for d in self.dscp:
+            yield {'eth_type': 0x0800, 'ip_dscp': d}
+
+    def port_matches(self):
+        """Matches for unmarked mice traffic at the ingress edge (both directions of a flow).
+
+        OF1.3 cannot mask L4 ports, so each port of a range is one rule.
+        """
+        for port in self.ports:
+            for proto, src, dst in ((6, 'tcp_src', 'tcp_dst'), (17, 'udp_src', 'udp_dst')):
+                yield {'eth_type': 0x0800, 'ip_proto': proto, dst: port}
+                yield {'eth_type': 0x0800, 'ip_proto': proto, src: port}
+
+
+def switch_ports(model, sw):
+    """Mininet interface names of a switch's wired ports."""
+    return [f'{sw.name}-eth{port}' for port in range(1, model.stride)
+            if model.peer(sw.index, port)[0] != NO_PEER]
+
+
+OWNER_KEY = 'fat-tree-switch'
+
+
+def find_command(owner):
+    """ovs-vsctl argv listing (QoS uuid, queues) rows created for switch ``owner``."""
+    return ['ovs-vsctl', '--bare', '--columns=_uuid,queues', 'find', 'qos',
+            f'external_ids:{OWNER_KEY}={owner}']
+
+
+def parse_find(output):
+    """[(qos uuid, [queue uuids])] from find_command() output."""
+    rows = []
+    for record in output.strip().split('\n\n'):
+        lines = record.strip().splitlines()
+        if not lines:
+            continue
+        queues = lines[1].split() if len(lines) > 1 else []
+        rows.append((lines[0].strip(), [q.partition('=')[2] for q in queues]))
+    return rows
+
+
+def qos_command(ports, rate_bps, mice_share=DEFAULT_MICE_SHARE, owner=None, stale=()):
+    """ovs-vsctl argv giving every port in ``ports`` one shared bulk/mice HTB QoS.
+
+    QoS/Queue 是 OVSDB 的根表，不被引用也不会自动删除；``stale`` (parse_find 的结果)
+    在同一个事务里删掉，交换机重连或控制器重启时不会留下孤立的行。
+    """
+    mice = int(rate_bps * mice_share)
+    args = ['ovs-vsctl']
+    for port in ports:
+        args += ['--', 'set', 'port', port, 'qos=@qos']
+    for qos, queues in stale:
+        args += ['--', 'destroy', 'qos', qos]
+        for queue in queues:
+            args += ['--', 'destroy', 'queue', queue]
+    args += ['--', '--id=@qos', 'create', 'qos', 'type=linux-htb', f'other-config:max-rate={rate_bps}',
+             f'queues:{QUEUE_BULK}=@bulk', f'queues:{QUEUE_MICE}=@mice']
+    if owner is not None:
+        args.append(f'external_ids:{OWNER_KEY}={owner}')
+    args += ['--', '--id=@bulk', 'create', 'queue', f'other-config:min-rate={rate_bps - mice}',
+             f'other-config:max-rate={rate_bps}', 'other-config:priority=1',
+             '--', '--id=@mice', 'create', 'queue', f'other-config:min-rate={mice}',
+             f'other-config:max-rate={rate_bps}', 'other-config:priority=0']
+    return args
+
+
+def clear_command(ports, stale=()):
+    """ovs-vsctl argv removing the QoS from ``ports`` and destroying the ``stale`` rows.
+
+    只删 parse_find 找到的、带 external_ids:fat-tree-switch 的行；同一主机上其他
+    QoS/Queue (不是控制器建的) 不动。
+    """
+    args = ['ovs-vsctl']
+    for port in ports:
+        args += ['--', 'clear', 'port', port, 'qos']
+    for qos, queues in stale:
+        args += ['--', 'destroy', 'qos', qos]
+        for queue in queues:
+            args += ['--', 'destroy', 'queue', queue]
+    return args
@@ -1,17 +1,89 @@
+import os
+import random
+import subprocess
+import time
+
 from ryu.base import app_manager
 from ryu.controller import ofp_event
-from ryu.controller.handler import CONFIG_DISPATCHER
+from ryu.controller.handler import CONFIG_DISPATCHER, DEAD_DISPATCHER, MAIN_DISPATCHER
 from ryu.controller.handler import set_ev_cls
 from ryu.ofproto import ofproto_v1_3
+from ryu.lib import hub
+from ryu.lib.packet import igmp
+from ryu.lib.packet import packet
+
+from control_channel import ControlChannel
+from controller_stats import STATS, stats_loop, timed
+from fat_tree_elastic import DEFAULT_HEADROOM, Consolidator, active_switches, restrict
+from fat_tree_labels import ROUTING_MODES, VID_PRESENT, LabelPlan, path_label
+from fat_tree_model import DEFAULT_MODEL_PATH, ROLE_AGG, ROLE_CORE, ROLE_EDGE, FatTreeModel, load_model
+from fat_tree_qos import QUEUE_MICE, MiceClasses, find_command, parse_find, qos_command, switch_ports
+from fat_tree_multicast import (BROADCAST_GROUP_ID, GROUP, MULTICAST_NET, GroupMembership,
+                                broadcast_forwarding, forwarding, root_for)
+from fat_tree_uplinks import load_uplinks
 
 class FatTreeRouting(app_manager.RyuApp):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
 
     def __init__(self, *args, **kwargs):
         super(FatTreeRouting, self).__init__(*args, **kwargs)
-        self.k = 4  # Fat-tree parameter
+        # Fat-tree / Clos model: $FAT_TREE_MODEL artifact (or $FAT_TREE_K), default k=4
+        self.model, source = load_model()
+        self.k = self.model.k  # pod 数 (fat-tree 时即 k)
+        if source is None:
+            self.logger.warning("No model artifact (%s) and $FAT_TREE_K unset: assuming %s. "
+                                "Write one with fat_tree_model.py or the topology's --model-out",
+                                os.environ.get('FAT_TREE_MODEL', DEFAULT_MODEL_PATH), self.model.describe())
+        self.logger.info("Loaded fat-tree model %s from %s: %s", self.model.describe(),
+                         source or 'default', self.model.tiers)
+        # 上行分流表: $FAT_TREE_UPLINKS (fat_tree_uplinks.py 生成)，否则为原后缀公式
+        self.uplinks = load_uplinks(self.model)
+        # 路由模式: ip (前缀/后缀规则) 或 label (ingress edge 打 VLAN 路径标签，见 fat_tree_labels.py)
+        self.mode = os.environ.get('FAT_TREE_ROUTING_MODE', 'ip')
+        if self.mode not in ROUTING_MODES:
+            raise ValueError(f"FAT_TREE_ROUTING_MODE must be one of {ROUTING_MODES}, got {self.mode!r}")
+        self.labels = LabelPlan(self.model) if self.mode == 'label' else None
+        self.reroutes = {}          # (dpid, barrier xid) -> 进行中的改路由
+        self.pins = {}              # (src ip, dst ip) -> (agg, row)，reroute() 固定的路径
+        # $FAT_TREE_QOS=1: mice/bulk 优先级队列，table 0 分类，路由规则在 table 1 (fat_tree_qos.py)
+        self.qos = MiceClasses.from_env() if os.environ.get('FAT_TREE_QOS') else None
+        self.route_table = 1 if self.qos is not None else 0
+        self.link_rate = int(float(os.environ.get('FAT_TREE_LINK_MBPS', 1000)) * 1e6)
+        self.msgs_sent = 0
+        self.expansion = None       # 进行中的在线扩容 (等待新交换机连接)
+        # 控制通道: 路由全部静态下发，只有 edge 上的 IGMP 报文送往控制器 (OFPR_ACTION)
+        self.channel = ControlChannel(self.logger, packet_in=('action',), port_status=(),
+                                      flow_removed=(), miss_send_len=None)
+        # 广播/组播分发树 (OFPGT_ALL 组)，组成员由 edge 上的 IGMP snooping 学习
+        self.broadcast = broadcast_forwarding(self.model)
+        self.membership = GroupMembership()
+        self.mcast_tables = {}      # group ip -> 已下发的 forwarding() 结果
+        self.datapaths = {}
+        # 统计开启时 ($FAT_TREE_STATS=1) 周期输出汇总
+        if STATS.enabled:
+            self.stats_thread = hub.spawn(stats_loop, self.logger, hub.sleep)
+        # $FAT_TREE_REROUTE_INTERVAL: 周期性随机改一条流的路径，用于测量改路由延迟
+        interval = os.environ.get('FAT_TREE_REROUTE_INTERVAL')
+        if interval:
+            self.reroute_thread = hub.spawn(self.reroute_loop, float(interval))
+        # $FAT_TREE_MODEL_WATCH: 轮询模型文件，pod 增加时在线扩容 (只下发增量)
+        self.model_path = os.environ.get('FAT_TREE_MODEL', DEFAULT_MODEL_PATH)
+        self.model_mtime = os.path.getmtime(self.model_path) if os.path.exists(self.model_path) else None
+        interval = os.environ.get('FAT_TREE_MODEL_WATCH')
+        if interval:
+            self.watch_thread = hub.spawn(self.model_watch_loop, float(interval))
+        # $FAT_TREE_ELASTIC=<秒>: 按上行端口计数把流量收拢到最少的 agg plane / core row
+        self.elastic = None
+        interval = os.environ.get('FAT_TREE_ELASTIC')
+        if interval:
+            capacity = self.link_rate / 8
+            headroom = float(os.environ.get('FAT_TREE_ELASTIC_HEADROOM', DEFAULT_HEADROOM))
+            self.elastic = Consolidator(self.model, capacity, headroom)
+            self.full_uplinks = self.uplinks
+            self.elastic_thread = hub.spawn(self.elastic_loop, float(interval))
 
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
+    @timed('switch_features')
     def switch_features_handler(self, ev):
         dp = ev.msg.datapath
         dpid = dp.id
@@ -20,87 +92,577 @@ class FatTreeRouting(app_manager.RyuApp):
 
         self.logger.info(f"Switch connected: DPID={format(dpid, '016x')}")
 
-        # (0) Table-miss: drop everything else
+        before = self.msgs_sent
+        self.channel.configure(dp)
+        self.datapaths[dpid] = dp
+
+        # (0) Table-miss: drop everything else; 清掉交换机上残留的组
         match = parser.OFPMatch()
         self.add_flow(dp, 0, match, [])
-
-        # (1) Allow ARP broadcast
-        match = parser.OFPMatch(eth_type=0x0806)
-        actions = [parser.OFPActionOutput(ofproto.OFPP_FLOOD)]
-        self.add_flow(dp, 1, match, actions)
+        req = parser.OFPGroupMod(dp, ofproto.OFPGC_DELETE, ofproto.OFPGT_ALL, ofproto.OFPG_ALL)
+        self.send(dp, req)
 
         # (2) Install role-specific flow rules
         role, detail = self.identify_switch(dpid)
+        if role is None and self.check_model():
+            # 新 pod 的交换机可能先于下一次轮询连上来
+            role, detail = self.identify_switch(dpid)
         if role == 'edge':
             self.install_edge_flows(dp, *detail)
         elif role == 'agg':
             self.install_agg_flows(dp, *detail)
         elif role == 'core':
             self.install_core_flows(dp)
+        else:
+            self.logger.warning(f"Unknown DPID={format(dpid, '016x')} for {self.model.describe()}, no routes installed")
+            return
 
-    def identify_switch(self, dpid):
-        x = dpid & 0xff               # i (列号)
-        y = (dpid >> 8) & 0xff        # j (行号)
-        z = (dpid >> 16) & 0xff       # pod 或 k
-
-        if z == self.k:
-            return 'core', (y, x)
-        elif y >= self.k // 2:
-            return 'agg', (z, y - self.k // 2)
+        # (1) 广播 / ARP: 沿广播树在交换机内复制 (原 OFPP_FLOOD 在有环的 fat-tree 上会形成风暴)
+        sw = self.model.switch_by_dpid(dpid)
+        index = sw.index
+        self.install_broadcast(dp, index)
+        if self.qos is not None:
+            self.install_qos(dp, sw)
+
+        # (3) 组播: 未知组丢弃 (不能落到后缀分流规则上)，edge 上 IGMP 送控制器，恢复已有的组
+        match = parser.OFPMatch(eth_type=0x0800, ipv4_dst=MULTICAST_NET)
+        self.add_flow(dp, 5, match, [])
+        if role == 'edge':
+            match = parser.OFPMatch(eth_type=0x0800, ip_proto=2)
+            actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER, ofproto.OFPCML_NO_BUFFER)]
+            self.add_flow(dp, 30, match, actions)
+        for group_ip, table in self.mcast_tables.items():
+            entry = table.get(index)
+            if entry is not None:
+                self.program_multicast(dp, group_ip, None, entry)
+        if self.expansion is not None and dpid in self.expansion['pending']:
+            self.expansion_progress(dpid, self.msgs_sent - before)
+
+    def install_broadcast(self, dp, index, old=None):
+        """Broadcast/ARP tree entry; ``old`` is the entry already on the switch, if any."""
+        parser = dp.ofproto_parser
+        ofproto = dp.ofproto
+        entry = self.broadcast.get(index)
+        old_group = old is not None and old[0] == GROUP
+        command = ofproto.OFPGC_MODIFY if old_group else ofproto.OFPGC_ADD
+        actions = self.tree_actions(dp, BROADCAST_GROUP_ID, entry, command)
+        # 组内端口变化时只改组，引用组的流表项不用重发
+        if actions and not (old_group and entry[0] == GROUP):
+            self.add_flow(dp, 2, parser.OFPMatch(eth_dst='ff:ff:ff:ff:ff:ff'), actions)
+            self.add_flow(dp, 1, parser.OFPMatch(eth_type=0x0806), actions)
+
+    @set_ev_cls(ofp_event.EventOFPStateChange, DEAD_DISPATCHER)
+    def state_change_handler(self, ev):
+        if ev.datapath.id is not None:
+            self.datapaths.pop(ev.datapath.id, None)
+
+    @set_ev_cls([ofp_event.EventOFPPortStatus, ofp_event.EventOFPFlowRemoved], MAIN_DISPATCHER)
+    def async_msg_handler(self, ev):
+        # 只计数: SetAsync 过滤掉的异步消息在 $FAT_TREE_CHANNEL=off 时会出现在统计里
+        STATS.recv(ev.msg.datapath.id, ev.msg)
+
+    # === IGMP snooping (edge switches) ===
+    @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
+    @timed('packet_in')
+    def packet_in_handler(self, ev):
+        msg = ev.msg
+        dp = msg.datapath
+        STATS.recv(dp.id, msg)
+        sw = self.model.switch_by_dpid(dp.id)
+        in_port = msg.match['in_port']
+        if sw is None or sw.role_name != 'edge' or in_port > self.model.hosts_per_edge:
+            return
+        host = self.model.host_node(sw.pod, sw.position, in_port - 1)
+
+        changed = set()
+        for group_ip, joined in self.igmp_changes(packet.Packet(msg.data)):
+            if joined:
+                updated = self.membership.join(group_ip, host)
+            else:
+                updated = self.membership.leave(group_ip, host)
+            if updated:
+                changed.add(group_ip)
+        for group_ip in changed:
+            self.update_multicast(group_ip)
+
+    def igmp_changes(self, pkt):
+        """Yield (group ip, joined) from an IGMPv1/v2/v3 report or leave."""
+        v3 = pkt.get_protocol(igmp.igmpv3_report)
+        if v3 is not None:
+            for rec in v3.records:
+                if rec.type_ in (igmp.MODE_IS_EXCLUDE, igmp.CHANGE_TO_EXCLUDE_MODE):
+                    yield rec.address, True
+                elif rec.type_ in (igmp.MODE_IS_INCLUDE, igmp.ALLOW_NEW_SOURCES) and rec.srcs:
+                    yield rec.address, True
+                elif rec.type_ == igmp.CHANGE_TO_INCLUDE_MODE and not rec.srcs:
+                    yield rec.address, False
+            return
+        v2 = pkt.get_protocol(igmp.igmp)
+        if v2 is None:
+            return
+        if v2.msgtype in (igmp.IGMP_TYPE_REPORT_V1, igmp.IGMP_TYPE_REPORT_V2):
+            yield v2.address, True
+        elif v2.msgtype == igmp.IGMP_TYPE_LEAVE:
+            yield v2.address, False
+
+    # === Distribution trees ===
+    def multicast_root(self, group_ip):
+        """(core row, plane) of a group's tree, inside the active set when consolidating."""
+        row, plane = root_for(self.model, group_ip)
+        if self.elastic is not None:
+            planes, rows = self.elastic.current
+            row, plane = row % rows, plane % planes
+        return row, plane
+
+    def update_multicast(self, group_ip):
+        """Recompute one group's tree and reprogram only the switches that changed."""
+        members = self.membership.members.get(group_ip, ())
+        new = forwarding(self.model, members, self.multicast_root(group_ip))
+        old = self.mcast_tables.get(group_ip, {})
+        changed = 0
+        for index in set(old) | set(new):
+            if old.get(index) == new.get(index):
+                continue
+            dp = self.datapaths.get(self.model.switches[index].dpid)
+            if dp is not None:
+                self.program_multicast(dp, group_ip, old.get(index), new.get(index))
+                changed += 1
+        if new:
+            self.mcast_tables[group_ip] = new
+        else:
+            self.mcast_tables.pop(group_ip, None)
+        self.logger.info("Multicast %s: %d members, %d switches reprogrammed",
+                         group_ip, len(members), changed)
+
+    def program_multicast(self, dp, group_ip, old, new):
+        parser = dp.ofproto_parser
+        ofproto = dp.ofproto
+        gid = self.membership.group_id(group_ip)
+        match = parser.OFPMatch(eth_type=0x0800, ipv4_dst=group_ip)
+        old_group = old is not None and old[0] == GROUP
+        if new is None:
+            mod = parser.OFPFlowMod(datapath=dp, table_id=self.route_table,
+                                    command=ofproto.OFPFC_DELETE_STRICT, priority=20, match=match,
+                                    out_port=ofproto.OFPP_ANY, out_group=ofproto.OFPG_ANY)
+            self.send(dp, mod)
         else:
-            return 'edge', (z, y)
+            command = ofproto.OFPGC_MODIFY if old_group else ofproto.OFPGC_ADD
+            self.add_flow(dp, 20, match, self.tree_actions(dp, gid, new, command))
+        if old_group and (new is None or new[0] != GROUP):
+            req = parser.OFPGroupMod(dp, ofproto.OFPGC_DELETE, ofproto.OFPGT_ALL, gid)
+            self.send(dp, req)
+
+    def tree_actions(self, dp, group_id, entry, command):
+        """Actions for one tree entry; tree switches get an OFPGT_ALL group first."""
+        if entry is None:
+            return []
+        parser = dp.ofproto_parser
+        kind, ports = entry
+        if kind != GROUP:
+            return [parser.OFPActionOutput(ports)]
+        # 交换机不会从入端口再发出，同一个组既向下分发也把本地源送上树
+        buckets = [parser.OFPBucket(actions=[parser.OFPActionOutput(port)]) for port in ports]
+        req = parser.OFPGroupMod(dp, command, dp.ofproto.OFPGT_ALL, group_id, buckets)
+        self.send(dp, req)
+        return [parser.OFPActionGroup(group_id)]
+
+    # === Rerouting ===
+    def reroute(self, src_ip, dst_ip, agg, row):
+        """Pin the src -> dst flow to uplink ``agg`` and core ``row``.
+
+        IP 模式先改源 pod 的 agg、收到 barrier 后再改 ingress edge (避免半条路径)；
+        label 模式只改 ingress edge 一条规则。完成时间记入统计 'reroute'。
+        Returns the number of switches that will be changed.
+        """
+        src = self.model.host_by_ip(src_ip)
+        dst = self.model.host_by_ip(dst_ip)
+        if src is None or dst is None or (src.pod, src.edge) == (dst.pod, dst.edge):
+            raise ValueError(f"no uplink path between {src_ip} and {dst_ip}")
+        row = row if dst.pod != src.pod else 0
+        self.pins[(src_ip, dst_ip)] = (agg, row)
+        edge = self.model.switches[self.model.edge_index(src.pod, src.edge)]
+        uplink = self.model.hosts_per_edge + agg + 1
+        steps = []
+        if self.labels is not None:
+            steps.append((edge.dpid, self.labels.encode(dst.pod, dst.edge, row), uplink))
+        else:
+            if dst.pod != src.pod:
+                aggsw = self.model.switches[self.model.agg_index(src.pod, agg)]
+                steps.append((aggsw.dpid, None, self.model.edges + row + 1))
+            steps.append((edge.dpid, None, uplink))
+        token = {'src': src_ip, 'dst': dst_ip, 'steps': steps, 'switches': len(steps),
+                 't0': time.perf_counter()}
+        self._reroute_step(token)
+        return token['switches']
+
+    def _reroute_step(self, token):
+        dpid, vid, port = token['steps'].pop(0)
+        dp = self.datapaths.get(dpid)
+        if dp is None:
+            self.logger.warning("Reroute %s -> %s aborted: DPID=%016x not connected",
+                                token['src'], token['dst'], dpid)
+            return
+        parser = dp.ofproto_parser
+        match = parser.OFPMatch(eth_type=0x0800, ipv4_src=token['src'], ipv4_dst=token['dst'])
+        if vid is None:
+            actions = [parser.OFPActionOutput(port)]
+        else:
+            actions = self.label_actions(parser, vid, port)
+        self.add_flow(dp, 20, match, actions)
+        barrier = parser.OFPBarrierRequest(dp)
+        self.send(dp, barrier)
+        self.reroutes[(dp.id, barrier.xid)] = token
+
+    @set_ev_cls(ofp_event.EventOFPBarrierReply, MAIN_DISPATCHER)
+    def barrier_reply_handler(self, ev):
+        token = self.reroutes.pop((ev.msg.datapath.id, ev.msg.xid), None)
+        if token is None:
+            return
+        if token['steps']:
+            self._reroute_step(token)
+            return
+        elapsed = time.perf_counter() - token['t0']
+        STATS.observe('reroute', elapsed)
+        self.logger.info("Rerouted %s -> %s (%s mode, %d switches) in %.2f ms",
+                         token['src'], token['dst'], self.mode, token['switches'], elapsed * 1e3)
+
+    def reroute_loop(self, interval):
+        rng = random.Random(0)
+        hosts = list(self.model.hosts())
+        while True:
+            hub.sleep(interval)
+            src, dst = rng.sample(hosts, 2)
+            if (src.pod, src.edge) == (dst.pod, dst.edge):
+                continue
+            self.reroute(src.ip, dst.ip, rng.randrange(self.model.aggs), rng.randrange(self.model.core_rows))
+
+    # === Live expansion ===
+    def model_watch_loop(self, interval):
+        while True:
+            hub.sleep(interval)
+            self.check_model()
 
+    def check_model(self):
+        """Reload the model file if it changed; True if the fabric grew."""
+        if not os.path.exists(self.model_path):
+            return False
+        try:
+            mtime = os.path.getmtime(self.model_path)
+            if mtime == self.model_mtime:
+                return False
+            model = FatTreeModel.load(self.model_path)
+        except (ValueError, OSError) as e:
+            # 读不了 (写到一半、被删除) 时不更新 mtime，下一轮重试
+            self.logger.warning("Model %s not loaded (%s); will retry", self.model_path, e)
+            return False
+        self.model_mtime = mtime
+        if model.pods == self.model.pods and model.tiers == self.model.tiers:
+            return False
+        try:
+            self.expand(model)
+        except ValueError as e:
+            self.logger.warning("Model %s ignored (%s); restart the controller to apply it",
+                                self.model_path, e)
+            return False
+        return True
+
+    def expand(self, model):
+        """Switch to a grown ``model`` and program only the delta on connected switches.
+
+        Existing switches get what the new pods add: core downlinks, uplink
+        entries for new keys, broadcast/multicast tree ports and, in label
+        mode, ingress labels for the new hosts. New switches are programmed
+        in full when they connect. Returns the number of messages sent.
+        """
+        old = self.model
+        same = dict(old.tiers, pods=model.pods) == model.tiers
+        if not same or model.pods < old.pods or \
+                any(model.switches[sw.index].dpid != sw.dpid for sw in old.switches):
+            raise ValueError(f"{model.describe()} is not a growth of {old.describe()}")
+        old_uplinks, old_broadcast = self.uplinks, self.broadcast
+        t0 = time.perf_counter()
+
+        self.model = model
+        self.k = model.k
+        if self.elastic is not None:
+            self.full_uplinks = self.full_uplinks.expand(model.pods)
+            self.elastic.model = model
+            self.uplinks = restrict(self.full_uplinks, *self.elastic.current)
+        else:
+            self.uplinks = old_uplinks.expand(model.pods)
+        self.labels = LabelPlan(model) if self.mode == 'label' else None
+        self.broadcast = broadcast_forwarding(model)
+        # 主机编号排在所有交换机之后，新增交换机使已有主机整体后移
+        self.membership.remap(model.n_switches - old.n_switches)
+
+        start = self.msgs_sent
+        touched = 0
+        for dpid, dp in list(self.datapaths.items()):
+            sw = old.switch_by_dpid(dpid)
+            if sw is None:
+                continue
+            before = self.msgs_sent
+            self.install_delta(dp, sw, old, old_uplinks, old_broadcast)
+            touched += self.msgs_sent > before
+        for group_ip in list(self.mcast_tables):
+            self.update_multicast(group_ip)
+        sent = self.msgs_sent - start
+
+        pending = {sw.dpid for sw in model.switches[old.n_switches:]}
+        self.expansion = {'t0': t0, 'pods': (old.pods, model.pods), 'delta_msgs': sent,
+                          'touched': touched, 'pending': pending, 'new_msgs': 0, 'new': len(pending)}
+        self.logger.info("Expanding %s -> %s: %d messages to %d of %d existing switches, "
+                         "waiting for %d new switches", old.describe(), model.describe(),
+                         sent, touched, old.n_switches, len(pending))
+        return sent
+
+    def install_delta(self, dp, sw, old, old_uplinks, old_broadcast):
+        """Entries an existing switch needs after growing from ``old``."""
+        if sw.role == ROLE_CORE:
+            self.install_core_flows(dp, range(old.pods, self.model.pods))
+        else:
+            self.install_uplink_delta(dp, sw, old_uplinks)
+        if old_broadcast.get(sw.index) != self.broadcast.get(sw.index):
+            self.install_broadcast(dp, sw.index, old_broadcast.get(sw.index))
+
+    def install_uplink_delta(self, dp, sw, old_uplinks):
+        """Uplink entries (or ingress labels) of an edge/agg switch that differ from ``old_uplinks``."""
+        if sw.role == ROLE_AGG and self.labels is None:
+            before = dict(old_uplinks.agg_entries(sw.pod, sw.position))
+            self.install_agg_uplinks(dp, [(key, row) for key, row in self.uplinks.agg_entries(sw.pod, sw.position)
+                                          if before.get(key) != row])
+        elif sw.role == ROLE_EDGE and self.labels is None:
+            before = dict(old_uplinks.edge_entries(sw.pod, sw.position))
+            self.install_edge_uplinks(dp, [(key, agg) for key, agg in self.uplinks.edge_entries(sw.pod, sw.position)
+                                           if before.get(key) != agg])
+        elif sw.role == ROLE_EDGE:
+            # 旧表没有的 pod (刚扩容) 一律视为新路径
+            changed = [h for h in self.model.hosts()
+                       if h.pod >= old_uplinks.pods
+                       or path_label(self.labels, old_uplinks, sw.pod, sw.position, h)
+                       != path_label(self.labels, self.uplinks, sw.pod, sw.position, h)]
+            self.install_edge_ingress(dp, sw.pod, sw.position, changed)
+
+    def apply_uplinks(self, table):
+        """Switch to another uplink table for the same fabric; only changed entries are sent."""
+        old, self.uplinks = self.uplinks, table
+        start = self.msgs_sent
+        for dpid, dp in list(self.datapaths.items()):
+            sw = self.model.switch_by_dpid(dpid)
+            if sw is not None and sw.role != ROLE_CORE:
+                self.install_uplink_delta(dp, sw, old)
+        return self.msgs_sent - start
+
+    # === Consolidation (ElasticTree) ===
+    def elastic_loop(self, interval):
+        while True:
+            hub.sleep(interval)
+            self.consolidate()
+            for dpid, dp in list(self.datapaths.items()):
+                sw = self.model.switch_by_dpid(dpid)
+                if sw is not None and sw.role != ROLE_CORE:
+                    self.send(dp, dp.ofproto_parser.OFPPortStatsRequest(dp, 0, dp.ofproto.OFPP_ANY))
+
+    @set_ev_cls(ofp_event.EventOFPPortStatsReply, MAIN_DISPATCHER)
+    def port_stats_reply_handler(self, ev):
+        msg = ev.msg
+        STATS.recv(msg.datapath.id, msg)
+        sw = self.model.switch_by_dpid(msg.datapath.id)
+        if self.elastic is None or sw is None:
+            return
+        now = time.monotonic()
+        for stat in msg.body:
+            self.elastic.observe(sw, stat.port_no, stat.rx_bytes, stat.tx_bytes, now)
+
+    def consolidate(self):
+        """Apply the consolidator's decision; returns the number of messages sent."""
+        before = self.elastic.current
+        planes, rows = self.elastic.decide()
+        if (planes, rows) == before:
+            return 0
+        start = self.msgs_sent
+        self.apply_uplinks(restrict(self.full_uplinks, planes, rows))
+        # 组播树的根随活跃集合移动 (multicast_root)，只改有变化的交换机
+        for group_ip in list(self.mcast_tables):
+            self.update_multicast(group_ip)
+        sent = self.msgs_sent - start
+        pins = [(self.model.host_by_ip(src), self.model.host_by_ip(dst), agg, row)
+                for (src, dst), (agg, row) in self.pins.items()]
+        active = active_switches(self.model, planes, rows, pins)
+        drainable = [sw.name for sw in self.model.switches if sw.index not in active]
+        self.logger.info("Elastic: %d/%d agg planes, %d/%d core rows, %d/%d switches active "
+                         "(%d messages); drainable: %s", planes, self.model.aggs, rows,
+                         self.model.core_rows, len(active), self.model.n_switches, sent,
+                         ' '.join(drainable) or '-')
+        return sent
+
+    def expansion_progress(self, dpid, sent):
+        exp = self.expansion
+        exp['pending'].discard(dpid)
+        exp['new_msgs'] += sent
+        if exp['pending']:
+            return
+        elapsed = time.perf_counter() - exp['t0']
+        STATS.observe('expansion', elapsed)
+        self.logger.info("Expansion %d -> %d pods programmed in %.1f ms: %d messages to %d existing "
+                         "switches (delta), %d messages to %d new switches",
+                         exp['pods'][0], exp['pods'][1], elapsed * 1e3, exp['delta_msgs'],
+                         exp['touched'], exp['new_msgs'], exp['new'])
+        self.expansion = None
+
+    # === Mice-flow queuing ===
+    def install_qos(self, dp, sw):
+        """Table 0 classifier (mice -> queue 1, everything -> routing table) and the OVS queues."""
+        parser = dp.ofproto_parser
+        ofproto = dp.ofproto
+        goto = parser.OFPInstructionGotoTable(self.route_table)
+        self.classify(dp, 0, parser.OFPMatch(), [goto])
+        mice = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS,
+                                             [parser.OFPActionSetQueue(QUEUE_MICE)]), goto]
+        for fields in self.qos.marked():
+            self.classify(dp, 10, parser.OFPMatch(**fields), mice)
+        if sw.role == ROLE_EDGE:
+            # 按端口识别的 mice 在 ingress edge 打上 DSCP，后面的交换机按标记入队
+            actions = [parser.OFPActionSetField(ip_dscp=self.qos.mark), parser.OFPActionSetQueue(QUEUE_MICE)]
+            mark = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS, actions), goto]
+            for fields in self.qos.port_matches():
+                self.classify(dp, 5, parser.OFPMatch(**fields), mark)
+        hub.spawn(self.configure_queues, sw)
+
+    def classify(self, dp, priority, match, inst):
+        mod = dp.ofproto_parser.OFPFlowMod(datapath=dp, table_id=0, priority=priority,
+                                           match=match, instructions=inst)
+        self.send(dp, mod)
+
+    def configure_queues(self, sw):
+        ports = switch_ports(self.model, sw)
+        found = subprocess.run(find_command(sw.name), capture_output=True, text=True)
+        stale = parse_find(found.stdout) if found.returncode == 0 else []
+        result = subprocess.run(qos_command(ports, self.link_rate, owner=sw.name, stale=stale),
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            self.logger.warning("Queues on %s not configured: %s", sw.name, result.stderr.strip())
+        else:
+            self.logger.debug("Queues configured on %s (%d ports)", sw.name, len(ports))
+
+    @set_ev_cls(ofp_event.EventOFPErrorMsg, [CONFIG_DISPATCHER, MAIN_DISPATCHER])
+    def error_msg_handler(self, ev):
+        if not self.channel.handle_error(ev.msg):
+            self.logger.debug("Error from DPID=%016x type=%d code=%d",
+                              ev.msg.datapath.id, ev.msg.type, ev.msg.code)
+
+    def identify_switch(self, dpid):
+        # O(1) 查表: role + (pod, index)；core 为 (row, col)
+        return self.model.identify(dpid)
+
+
+    def send(self, dp, msg):
+        dp.send_msg(msg)
+        STATS.sent(dp.id, msg)
+        self.msgs_sent += 1
 
     def add_flow(self, dp, priority, match, actions):
         parser = dp.ofproto_parser
         ofproto = dp.ofproto
         inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS, actions)]
-        mod = parser.OFPFlowMod(datapath=dp, priority=priority, match=match, instructions=inst)
-        dp.send_msg(mod)
-        self.logger.info(f"Flow added: DPID={format(dp.id, '016x')} prio={priority}, match={match}, actions={actions}")
+        mod = parser.OFPFlowMod(datapath=dp, table_id=self.route_table, priority=priority,
+                                match=match, instructions=inst)
+        self.send(dp, mod)
+        # debug + 惰性格式化: 大规模时逐条 INFO 日志本身就是瓶颈
+        self.logger.debug("Flow added: DPID=%016x prio=%d, match=%s, actions=%s", dp.id, priority, match, actions)
 
     # === Edge Switch Rules ===
     def install_edge_flows(self, dp, pod, edge):
         parser = dp.ofproto_parser
-        # (1) Host-specific规则: 10.pod.edge.(2/3) -> 本地端口1/2
-        for h in range(self.k // 2):
+        # (1) Host-specific规则: 10.pod.edge.(h+2) -> 本地端口 h+1
+        for h in range(self.model.hosts_per_edge):
             ip = f'10.{pod}.{edge}.{h + 2}'
             port = h + 1
             match = parser.OFPMatch(eth_type=0x0800, ipv4_dst=(ip, "255.255.255.255"))
             actions = [parser.OFPActionOutput(port)]
             self.add_flow(dp, 10, match, actions)
-        # (2) 上行: 其它IP包全部上送agg
-        for x in range(2, 2 + self.k // 2):  # host ID x
-            port = (x - 2 + edge) % (self.k // 2) + (self.k // 2) + 1  # 上行端口
-            ip = f'0.0.0.{x}'
-            match = parser.OFPMatch(eth_type=0x0800, ipv4_dst=(ip, "0.0.0.255"))
+        if self.labels is not None:
+            self.install_edge_label_flows(dp, pod, edge)
+            return
+        # (2) 上行: 其它IP包按上行分流表上送agg
+        self.install_edge_uplinks(dp, self.uplinks.edge_entries(pod, edge))
+
+    def install_edge_uplinks(self, dp, entries):
+        parser = dp.ofproto_parser
+        for key, agg in entries:
+            port = self.model.hosts_per_edge + agg + 1  # 上行端口
+            ip, mask = self.uplinks.key_match(key)
+            match = parser.OFPMatch(eth_type=0x0800, ipv4_dst=(ip, mask))
             actions = [parser.OFPActionOutput(port)]
             self.add_flow(dp, 1, match, actions)
 
+    def install_edge_label_flows(self, dp, pod, edge):
+        parser = dp.ofproto_parser
+        # (1) egress: 带标签的包 pop VLAN 后交给本地主机
+        for h in range(self.model.hosts_per_edge):
+            ip = f'10.{pod}.{edge}.{h + 2}'
+            match = parser.OFPMatch(vlan_vid=(VID_PRESENT, VID_PRESENT), eth_type=0x0800,
+                                    ipv4_dst=(ip, "255.255.255.255"))
+            actions = [parser.OFPActionPopVlan(), parser.OFPActionOutput(h + 1)]
+            self.add_flow(dp, 11, match, actions)
+        # (2) ingress: 每个远端主机 -> 按上行分流表选路径，push 路径标签
+        self.install_edge_ingress(dp, pod, edge, self.model.hosts())
+
+    def install_edge_ingress(self, dp, pod, edge, dsts):
+        parser = dp.ofproto_parser
+        for dst in dsts:
+            if (dst.pod, dst.edge) == (pod, edge):
+                continue
+            agg, vid = path_label(self.labels, self.uplinks, pod, edge, dst)
+            match = parser.OFPMatch(eth_type=0x0800, ipv4_dst=(dst.ip, "255.255.255.255"))
+            self.add_flow(dp, 1, match, self.label_actions(parser, vid, self.model.hosts_per_edge + agg + 1))
 
+    def label_actions(self, parser, vid, port):
+        return [parser.OFPActionPushVlan(0x8100),
+                parser.OFPActionSetField(vlan_vid=vid),
+                parser.OFPActionOutput(port)]
 
     # === Aggregation Switch Rules ===
     def install_agg_flows(self, dp, pod, agg):
         parser = dp.ofproto_parser
+        if self.labels is not None:
+            # label 模式: 本 pod 的标签下行到 edge，其它按标签里的 row 上行
+            for edge in range(self.model.edges):
+                match = parser.OFPMatch(vlan_vid=self.labels.match(pod=pod, edge=edge))
+                self.add_flow(dp, 10, match, [parser.OFPActionOutput(edge + 1)])
+            for row in range(self.model.core_rows):
+                match = parser.OFPMatch(vlan_vid=self.labels.match(row=row))
+                self.add_flow(dp, 1, match, [parser.OFPActionOutput(self.model.edges + row + 1)])
+            return
         # (1) 下行: 10.pod.edge.0/24 -> 对应edge端口
-        for edge in range(self.k // 2):
+        for edge in range(self.model.edges):
             subnet_ip = f'10.{pod}.{edge}.0'
             port = edge + 1
             match = parser.OFPMatch(eth_type=0x0800, ipv4_dst=(subnet_ip, "255.255.255.0"))
             actions = [parser.OFPActionOutput(port)]
             self.add_flow(dp, 10, match, actions)
-         # (2) 后缀分流：遍历所有主机IP，末尾为x的都下发到指定上行端口
-        for x in range(2, 2 + self.k // 2):
-            port = (x - 2 + agg) % (self.k // 2) + (self.k // 2) + 1
-            ip = f'0.0.0.{x}'
-            match = parser.OFPMatch(eth_type=0x0800, ipv4_dst=(ip, "0.0.0.255"))
+        # (2) 后缀分流：按上行分流表把去往其它pod的流量下发到指定上行端口
+        self.install_agg_uplinks(dp, self.uplinks.agg_entries(pod, agg))
+
+    def install_agg_uplinks(self, dp, entries):
+        parser = dp.ofproto_parser
+        for key, row in entries:
+            port = self.model.edges + row + 1
+            ip, mask = self.uplinks.key_match(key)
+            match = parser.OFPMatch(eth_type=0x0800, ipv4_dst=(ip, mask))
             actions = [parser.OFPActionOutput(port)]
             self.add_flow(dp, 1, match, actions)
     # === Core Switch Rules ===
-    def install_core_flows(self, dp):
+    def install_core_flows(self, dp, pods=None):
         parser = dp.ofproto_parser
+        pods = range(self.k) if pods is None else pods
+        if self.labels is not None:
+            for pod in pods:
+                match = parser.OFPMatch(vlan_vid=self.labels.match(pod=pod))
+                self.add_flow(dp, 10, match, [parser.OFPActionOutput(pod + 1)])
+            return
         # (1) 10.pod.0.0/16 -> pod对应端口
-        for pod in range(self.k):
+        for pod in pods:
             ip_prefix = f'10.{pod}.0.0'
             port = pod + 1
             match = parser.OFPMatch(eth_type=0x0800, ipv4_dst=(ip_prefix, "255.255.0.0"))
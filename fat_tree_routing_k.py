@@ -1,18 +1,36 @@
+import os
+
 from ryu.base import app_manager
 from ryu.controller import ofp_event
 from ryu.controller.handler import CONFIG_DISPATCHER
 from ryu.controller.handler import set_ev_cls
 from ryu.ofproto import ofproto_v1_3
+from ryu.lib import hub
+
+from controller_stats import STATS, stats_loop, timed
+from fat_tree_model import DEFAULT_MODEL_PATH, load_model
 
 class FatTreeRouting(app_manager.RyuApp):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
 
     def __init__(self, *args, **kwargs):
         super(FatTreeRouting, self).__init__(*args, **kwargs)
-        self.k = None  # 稍后通过DPID自动识别
+        # k 来自拓扑脚本写出的模型文件 (--model-out)，不再从第一个连接的DPID猜
+        self.model, source = load_model()
+        self.k = self.model.k
+        if source is None:
+            self.logger.warning("No model artifact (%s) and $FAT_TREE_K unset: assuming %s. "
+                                "Write one with fat_tree_model.py or the topology's --model-out",
+                                os.environ.get('FAT_TREE_MODEL', DEFAULT_MODEL_PATH), self.model.describe())
+        self.logger.info("Loaded fat-tree model %s from %s: %s", self.model.describe(),
+                         source or 'default', self.model.tiers)
+        # 统计开启时 ($FAT_TREE_STATS=1) 周期输出汇总
+        if STATS.enabled:
+            self.stats_thread = hub.spawn(stats_loop, self.logger, hub.sleep)
 
 
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
+    @timed('switch_features')
     def switch_features_handler(self, ev):
         dp = ev.msg.datapath
         dpid = dp.id
@@ -21,11 +39,6 @@ class FatTreeRouting(app_manager.RyuApp):
 
         self.logger.info(f"Switch connected: DPID={format(dpid, '016x')}")
 
-        # ✅ 先识别 k
-        if self.k is None:
-            self.k = self.infer_k_from_dpid(dpid)
-            self.logger.info(f"Inferred k = {self.k} from DPID = {format(dpid, '016x')}")
-
         # (0) Table-miss: drop everything else
         match = parser.OFPMatch()
         self.add_flow(dp, 0, match, [])
@@ -43,25 +56,14 @@ class FatTreeRouting(app_manager.RyuApp):
             self.install_agg_flows(dp, *detail)
         elif role == 'core':
             self.install_core_flows(dp)
+        else:
+            self.logger.warning(f"Unknown DPID={format(dpid, '016x')} for k={self.k}, no routes installed")
 
-    
-    
-    def infer_k_from_dpid(self, dpid):
-        z = (dpid >> 16) & 0xff
-        return z
 
     # === Switch Identification ===
     def identify_switch(self, dpid):
-        x = dpid & 0xff               # i (列号)
-        y = (dpid >> 8) & 0xff        # j (行号)
-        z = (dpid >> 16) & 0xff       # pod 或 k
-
-        if z == self.k:
-            return 'core', (y, x)
-        elif y >= self.k // 2:
-            return 'agg', (z, y - self.k // 2)
-        else:
-            return 'edge', (z, y)
+        # O(1) 查表: role + (pod, index)；core 为 (row, col)
+        return self.model.identify(dpid)
 
 
     def add_flow(self, dp, priority, match, actions):
@@ -70,21 +72,24 @@ class FatTreeRouting(app_manager.RyuApp):
         inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS, actions)]
         mod = parser.OFPFlowMod(datapath=dp, priority=priority, match=match, instructions=inst)
         dp.send_msg(mod)
-        self.logger.info(f"Flow added: DPID={format(dp.id, '016x')} prio={priority}, match={match}, actions={actions}")
+        STATS.sent(dp.id, mod)
+        # debug + 惰性格式化: 大规模时逐条 INFO 日志本身就是瓶颈
+        self.logger.debug("Flow added: DPID=%016x prio=%d, match=%s, actions=%s", dp.id, priority, match, actions)
 
     # === Edge Switch Rules ===
     def install_edge_flows(self, dp, pod, edge):
         parser = dp.ofproto_parser
-        # (1) Host-specific规则: 10.pod.edge.(2/3) -> 本地端口1/2
-        for h in range(self.k // 2):
+        H, A = self.model.hosts_per_edge, self.model.aggs
+        # (1) Host-specific规则: 10.pod.edge.(2..H+1) -> 本地端口1..H
+        for h in range(H):
             ip = f'10.{pod}.{edge}.{h + 2}'
             port = h + 1
             match = parser.OFPMatch(eth_type=0x0800, ipv4_dst=(ip, "255.255.255.255"))
             actions = [parser.OFPActionOutput(port)]
             self.add_flow(dp, 10, match, actions)
         # (2) 上行: 其它IP包全部上送agg
-        for x in range(2, 2 + self.k // 2):  # host ID x
-            port = (x - 2 + edge) % (self.k // 2) + (self.k // 2) + 1  # 上行端口
+        for x in range(2, 2 + H):  # host ID x
+            port = (x - 2 + edge) % A + H + 1  # 上行端口 (agg 在 H+1..H+A)
             ip = f'0.0.0.{x}'
             match = parser.OFPMatch(eth_type=0x0800, ipv4_dst=(ip, "0.0.0.255"))
             actions = [parser.OFPActionOutput(port)]
@@ -95,16 +100,17 @@ class FatTreeRouting(app_manager.RyuApp):
     # === Aggregation Switch Rules ===
     def install_agg_flows(self, dp, pod, agg):
         parser = dp.ofproto_parser
+        E, C = self.model.edges, self.model.core_rows
         # (1) 下行: 10.pod.edge.0/24 -> 对应edge端口
-        for edge in range(self.k // 2):
+        for edge in range(E):
             subnet_ip = f'10.{pod}.{edge}.0'
             port = edge + 1
             match = parser.OFPMatch(eth_type=0x0800, ipv4_dst=(subnet_ip, "255.255.255.0"))
             actions = [parser.OFPActionOutput(port)]
             self.add_flow(dp, 10, match, actions)
          # (2) 后缀分流：遍历所有主机IP，末尾为x的都下发到指定上行端口
-        for x in range(2, 2 + self.k // 2):
-            port = (x - 2 + agg) % (self.k // 2) + (self.k // 2) + 1
+        for x in range(2, 2 + self.model.hosts_per_edge):
+            port = (x - 2 + agg) % C + E + 1  # core row 在 E+1..E+C
             ip = f'0.0.0.{x}'
             match = parser.OFPMatch(eth_type=0x0800, ipv4_dst=(ip, "0.0.0.255"))
             actions = [parser.OFPActionOutput(port)]
@@ -0,0 +1,442 @@
+# Static uplink assignment for the fat-tree: table format + offline optimizer
+#
+# 控制器原来写死的后缀分流公式:
+#   edge_p_e  dst 后缀 x -> agg  (x - 2 + e) % A
+#   agg_p_a   dst 后缀 x -> core row (x - 2 + a) % C
+# (fat-tree 时 A = C = k/2)。UplinkTable 把它变成可加载的表；optimize()
+# 针对一组流量矩阵搜索新的表，让各矩阵 core 链路峰值相对其下界 (平均负载向上取整)
+# 的最坏比值最小。
+#
+# Key granularity:
+#   suffix : key = host slot (x - 2)，规则 0.0.0.x/0.0.0.255，表项数与原来相同
+#   host   : key = 全局主机编号，规则 /32，自由度更高但每台交换机 N_hosts 条
+#
+# Usage:
+#   python3 fat_tree_uplinks.py --k 4 --out fat_tree_uplinks.json --check
+#   FAT_TREE_UPLINKS=fat_tree_uplinks.json ryu-manager fat_tree_routing.py
+import json
+import math
+import os
+import random
+from array import array
+
+from fat_tree_model import add_tier_arguments, model_from_args
+
+DEFAULT_UPLINKS_PATH = 'fat_tree_uplinks.json'
+UPLINKS_FORMAT = 'fat-tree-uplinks'
+GRANULARITIES = ('suffix', 'host')
+
+
+class UplinkTable:
+    """edge[(pod, edge, key)] -> agg index, agg[(pod, agg, key)] -> core row."""
+
+    def __init__(self, pods, edges, aggs, hosts, core_rows, granularity='suffix',
+                 edge=None, agg=None):
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of {GRANULARITIES}")
+        self.pods = pods
+        self.edges = edges
+        self.aggs = aggs
+        self.hosts_per_edge = hosts
+        self.core_rows = core_rows
+        self.granularity = granularity
+        self.n_keys = hosts if granularity == 'suffix' else pods * edges * hosts
+        edge_size = pods * edges * self.n_keys
+        agg_size = pods * aggs * self.n_keys
+        if edge is None:
+            edge = array('B', bytes(edge_size))
+            agg = array('B', bytes(agg_size))
+            for pod in range(pods):
+                for key in range(self.n_keys):
+                    slot = self.key_slot(key)
+                    for e in range(edges):
+                        edge[self._edge_slot(pod, e, key)] = (slot + e) % aggs
+                    for a in range(aggs):
+                        agg[self._agg_slot(pod, a, key)] = (slot + a) % core_rows
+        if len(edge) != edge_size or len(agg) != agg_size:
+            raise ValueError(f"uplink table does not match {self.tiers}")
+        self.edge = edge
+        self.agg = agg
+
+    @classmethod
+    def for_model(cls, model, granularity='suffix'):
+        """Default (formula) table for a FatTreeModel."""
+        return cls(**model.tiers, granularity=granularity)
+
+    def expand(self, pods):
+        """Table for ``pods`` pods: existing entries kept, new ones from the formula."""
+        grown = UplinkTable(pods, self.edges, self.aggs, self.hosts_per_edge, self.core_rows,
+                            self.granularity)
+        for kind, per_pod in (('edge', self.edges), ('agg', self.aggs)):
+            old, new = self._entry(kind, 0, 0, 0)[0], grown._entry(kind, 0, 0, 0)[0]
+            for pod in range(self.pods):
+                for sw in range(per_pod):
+                    for key in range(self.n_keys):
+                        # host 粒度时 key 是全局主机编号，新旧表中同一主机的 key 相同
+                        new[grown._entry(kind, pod, sw, key)[1]] = old[self._entry(kind, pod, sw, key)[1]]
+        return grown
+
+    @property
+    def tiers(self):
+        return {'pods': self.pods, 'edges': self.edges, 'aggs': self.aggs,
+                'hosts': self.hosts_per_edge, 'core_rows': self.core_rows}
+
+    def _edge_slot(self, pod, edge, key):
+        return (pod * self.edges + edge) * self.n_keys + key
+
+    def _agg_slot(self, pod, agg, key):
+        return (pod * self.aggs + agg) * self.n_keys + key
+
+    def _entry(self, kind, pod, sw, key):
+        """(array, index) of one table entry; kind is 'edge' or 'agg'."""
+        if kind == 'edge':
+            return self.edge, self._edge_slot(pod, sw, key)
+        return self.agg, self._agg_slot(pod, sw, key)
+
+    def choices(self, kind):
+        """Number of possible values of an edge/agg entry."""
+        return self.aggs if kind == 'edge' else self.core_rows
+
+    # === Keys ===
+    def key_slot(self, key):
+        """Host slot (last byte - 2) of a key."""
+        return key if self.granularity == 'suffix' else key % self.hosts_per_edge
+
+    def key_of(self, pod, edge, slot):
+        if self.granularity == 'suffix':
+            return slot
+        return (pod * self.edges + edge) * self.hosts_per_edge + slot
+
+    def key_match(self, key):
+        """(ipv4_dst, mask) matched by a key."""
+        if self.granularity == 'suffix':
+            return f'0.0.0.{key + 2}', '0.0.0.255'
+        edge_no, slot = divmod(key, self.hosts_per_edge)
+        pod, edge = divmod(edge_no, self.edges)
+        return f'10.{pod}.{edge}.{slot + 2}', '255.255.255.255'
+
+    def key_local(self, key, pod, edge=None):
+        """True if a key is already delivered by the downlink rules of (pod[, edge])."""
+        if self.granularity == 'suffix':
+            return False
+        edge_no = key // self.hosts_per_edge
+        if edge is None:
+            return edge_no // self.edges == pod
+        return edge_no == pod * self.edges + edge
+
+    # === Lookups ===
+    def edge_uplink(self, pod, edge, key):
+        return self.edge[self._edge_slot(pod, edge, key)]
+
+    def agg_uplink(self, pod, agg, key):
+        return self.agg[self._agg_slot(pod, agg, key)]
+
+    def edge_entries(self, pod, edge):
+        """Yield (key, agg index) for an edge switch, skipping locally delivered keys."""
+        base = self._edge_slot(pod, edge, 0)
+        for key in range(self.n_keys):
+            if not self.key_local(key, pod, edge):
+                yield key, self.edge[base + key]
+
+    def agg_entries(self, pod, agg):
+        """Yield (key, core row) for an aggregation switch, skipping keys inside the pod."""
+        base = self._agg_slot(pod, agg, 0)
+        for key in range(self.n_keys):
+            if not self.key_local(key, pod):
+                yield key, self.agg[base + key]
+
+    # === Serialization ===
+    def to_dict(self):
+        return {
+            'format': UPLINKS_FORMAT,
+            'tiers': self.tiers,
+            'granularity': self.granularity,
+            'edge': list(self.edge),
+            'agg': list(self.agg),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('format') != UPLINKS_FORMAT:
+            raise ValueError("not an uplink table")
+        return cls(**data['tiers'], granularity=data['granularity'],
+                   edge=array('B', data['edge']), agg=array('B', data['agg']))
+
+    def save(self, path=DEFAULT_UPLINKS_PATH):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, path=DEFAULT_UPLINKS_PATH):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+def load_uplinks(model, path=None):
+    """Uplink table for the controller: ``path`` / $FAT_TREE_UPLINKS if given, else the formula.
+
+    The optimizer's default output in the working directory is not picked up on
+    its own: a table left over for another fabric would stop the controller.
+    """
+    path = path or os.environ.get('FAT_TREE_UPLINKS')
+    if path:
+        table = UplinkTable.load(path)
+        if table.tiers != model.tiers:
+            raise ValueError(f"uplink table {path} is for {table.tiers}, fabric is {model.tiers}")
+        return table
+    return UplinkTable.for_model(model)
+
+
+# === Routing ===
+
+def route(table, src, dst):
+    """Directed links used from host ``src`` to host ``dst`` (host numbers).
+
+    Links are tuples: ('host_up', h), ('edge_up', p, e, a), ('agg_up', p, a, j),
+    ('core_down', j, a, p), ('agg_down', p, a, e), ('host_down', h).
+    """
+    H, E = table.hosts_per_edge, table.edges
+    s_edge_no, d_edge_no = src // H, dst // H
+    links = [('host_up', src)]
+    if s_edge_no != d_edge_no:
+        sp, se = divmod(s_edge_no, E)
+        dp, de = divmod(d_edge_no, E)
+        key = table.key_of(dp, de, dst % H)
+        a = table.edge_uplink(sp, se, key)
+        links.append(('edge_up', sp, se, a))
+        if sp != dp:
+            j = table.agg_uplink(sp, a, key)
+            links.append(('agg_up', sp, a, j))
+            links.append(('core_down', j, a, dp))
+        links.append(('agg_down', dp, a, de))
+    links.append(('host_down', dst))
+    return links
+
+
+# === Traffic matrices ===
+# 每个矩阵是 (src, dst) 列表，src/dst 为主机在 model.hosts() 中的序号，需求均为 1
+
+def stride_matrix(n_hosts, stride):
+    return [(h, (h + stride) % n_hosts) for h in range(n_hosts)]
+
+
+def permutation_matrix(n_hosts, seed):
+    rng = random.Random(seed)
+    dst = list(range(n_hosts))
+    rng.shuffle(dst)
+    return [(h, d) for h, d in enumerate(dst) if h != d]
+
+
+def pod_shift_matrix(pods, per_pod, shift=1):
+    # pod p 的每台主机发给 pod p+shift 的每台主机 (all-to-all between pods)
+    return [(p * per_pod + s, ((p + shift) % pods) * per_pod + d)
+            for p in range(pods) for s in range(per_pod) for d in range(per_pod)]
+
+
+def default_matrices(model, seed=0):
+    H = model.hosts_per_edge
+    per_pod = model.edges * H
+    n_hosts = model.n_hosts
+    matrices = {
+        'stride1': stride_matrix(n_hosts, 1),
+        'stride_edge': stride_matrix(n_hosts, H),          # 下一台 edge 的同号主机
+        'stride_pod': stride_matrix(n_hosts, per_pod),     # 下一个 pod 的同号主机
+        'stride_pod+1': stride_matrix(n_hosts, per_pod + 1),
+        'pod_shift': pod_shift_matrix(model.pods, per_pod),
+    }
+    for i in range(3):
+        matrices[f'random{i}'] = permutation_matrix(n_hosts, seed + i)
+    return matrices
+
+
+# === Link load evaluation ===
+
+class LinkLoads:
+    """Per-matrix directed fabric link loads for one uplink table.
+
+    Link ids: edge->agg, agg->edge, then agg->core (up) and core->agg (down);
+    only the last two count as core links. Host links are not tracked here.
+    """
+
+    def __init__(self, table, matrices):
+        P, E, A, H, C = (table.pods, table.edges, table.aggs,
+                         table.hosts_per_edge, table.core_rows)
+        self.table = table
+        self.n_pod_links = P * E * A
+        self.core_base = 2 * self.n_pod_links
+        self.n_core_dir = P * A * C
+        self.n_links = self.core_base + 2 * self.n_core_dir
+        self.names = list(matrices)
+        self.flows = []
+        self.loads = []
+        # (matrix, src pod, key) -> flow ids，便于增量更新
+        self.by_pod_key = {}
+        for m, name in enumerate(self.names):
+            flows = []
+            for src, dst in matrices[name]:
+                s_edge_no, d_edge_no = src // H, dst // H
+                if s_edge_no == d_edge_no:
+                    continue
+                sp, se = divmod(s_edge_no, E)
+                dp, de = divmod(d_edge_no, E)
+                key = table.key_of(dp, de, dst % H)
+                self.by_pod_key.setdefault((m, sp, key), []).append(len(flows))
+                flows.append((sp, se, dp, de, key))
+            self.flows.append(flows)
+            self.loads.append(array('d', bytes(8 * self.n_links)))
+        for m in range(len(self.names)):
+            for f in range(len(self.flows[m])):
+                self._apply(m, f, 1.0)
+        # 每个矩阵 core 负载总和与分流表无关，平均值向上取整是任何分配都达不到更低的峰值
+        # (pod_shift 这类矩阵在任何分配下都等于这个下界)；目标按下界归一化，
+        # 否则一个改不动的矩阵就会把最坏值钉死，任何修改都不会被接受
+        self.bounds = [max(1.0, math.ceil(sum(self.core_loads(m)) / (2 * self.n_core_dir) - 1e-9))
+                       for m in range(len(self.names))]
+
+    def path(self, m, f):
+        sp, se, dp, de, key = self.flows[m][f]
+        t = self.table
+        E, A, C = t.edges, t.aggs, t.core_rows
+        a = t.edge_uplink(sp, se, key)
+        links = [(sp * E + se) * A + a]
+        if sp == dp:
+            links.append(self.n_pod_links + (dp * A + a) * E + de)
+            return links
+        j = t.agg_uplink(sp, a, key)
+        links.append(self.core_base + (sp * A + a) * C + j)
+        links.append(self.core_base + self.n_core_dir + (j * A + a) * t.pods + dp)
+        links.append(self.n_pod_links + (dp * A + a) * E + de)
+        return links
+
+    def _apply(self, m, f, sign):
+        loads = self.loads[m]
+        for link in self.path(m, f):
+            loads[link] += sign
+
+    def core_loads(self, m):
+        return self.loads[m][self.core_base:]
+
+    def objective(self):
+        """Lower is better: (worst peak / lower bound over all matrices, sum of
+        per-matrix peak / bound, #links at their matrix max, sum of squares)."""
+        worst, total_max, at_max, sumsq = 0.0, 0.0, 0, 0.0
+        for m in range(len(self.names)):
+            core = self.core_loads(m)
+            peak = max(core)
+            worst = max(worst, peak / self.bounds[m])
+            total_max += peak / self.bounds[m]
+            at_max += sum(1 for load in core if load == peak)
+            sumsq += sum(load * load for load in core)
+        return worst, total_max, at_max, sumsq
+
+    def stats(self, m):
+        """(peak, mean, lower bound of the peak) core link load of matrix m."""
+        core = self.core_loads(m)
+        return max(core), sum(core) / len(core), self.bounds[m]
+
+
+def _entry_flows(state, m, kind, pod, sw, key):
+    """Flow ids of matrix m whose path depends on one table entry."""
+    flows = state.flows[m]
+    result = []
+    for f in state.by_pod_key.get((m, pod, key), ()):
+        sp, se, dp, de, _ = flows[f]
+        if kind == 'edge':
+            if se == sw:
+                result.append(f)
+        elif dp != sp and state.table.edge_uplink(sp, se, key) == sw:
+            result.append(f)
+    return result
+
+
+def _set_entry(state, kind, pod, sw, key, value):
+    affected = [(m, _entry_flows(state, m, kind, pod, sw, key)) for m in range(len(state.names))]
+    for m, flows in affected:
+        for f in flows:
+            state._apply(m, f, -1.0)
+    arr, i = state.table._entry(kind, pod, sw, key)
+    arr[i] = value
+    for m, flows in affected:
+        for f in flows:
+            state._apply(m, f, 1.0)
+
+
+def optimize(table, matrices, max_rounds=1000):
+    """Local search on the entries feeding each matrix's hottest core links.
+
+    Modifies ``table`` in place and returns the final LinkLoads. Intended
+    for offline use at small/medium k (the evaluation is pure Python).
+    """
+    state = LinkLoads(table, matrices)
+    best = state.objective()
+    for _ in range(max_rounds):
+        improved = False
+        # 按峰值从高到低处理每个矩阵，找出其最热 core 链路上所有流对应的表项
+        order = sorted(range(len(state.names)), key=lambda m: -max(state.core_loads(m)))
+        for m in order:
+            core = state.core_loads(m)
+            peak = max(core)
+            hot = {link + state.core_base for link, load in enumerate(core) if load == peak}
+            candidates = set()
+            for f in range(len(state.flows[m])):
+                if hot.intersection(state.path(m, f)):
+                    sp, se, _, _, key = state.flows[m][f]
+                    candidates.add(('edge', sp, se, key))
+                    candidates.add(('agg', sp, table.edge_uplink(sp, se, key), key))
+
+            for kind, pod, sw, key in sorted(candidates):
+                arr, i = table._entry(kind, pod, sw, key)
+                current = arr[i]
+                for value in range(table.choices(kind)):
+                    if value == current:
+                        continue
+                    _set_entry(state, kind, pod, sw, key, value)
+                    score = state.objective()
+                    if score < best:
+                        best, current, improved = score, value, True
+                    else:
+                        _set_entry(state, kind, pod, sw, key, current)
+            if improved:
+                break
+        if not improved:
+            break
+    return state
+
+
+def report(state):
+    return {name: state.stats(m) for m, name in enumerate(state.names)}
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Optimize static fat-tree uplink assignment.')
+    add_tier_arguments(parser)
+    parser.add_argument('--granularity', choices=GRANULARITIES, default='host',
+                        help='suffix tables share one entry per host slot and rarely improve')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the random permutation matrix')
+    parser.add_argument('--rounds', type=int, default=1000)
+    parser.add_argument('--out', default=DEFAULT_UPLINKS_PATH)
+    parser.add_argument('--check', action='store_true', help='Exit 1 if the objective was not lowered')
+    args = parser.parse_args()
+
+    model = model_from_args(args)
+    matrices = default_matrices(model, args.seed)
+
+    initial = LinkLoads(UplinkTable.for_model(model, args.granularity), matrices)
+    before = report(initial)
+    table = UplinkTable.for_model(model, args.granularity)
+    final = optimize(table, matrices, args.rounds)
+    after = report(final)
+    table.save(args.out)
+
+    print(f"{'matrix':<12} {'bound':>5} {'max before':>10} {'mean before':>12} {'max after':>10} {'mean after':>11}")
+    for name in matrices:
+        print(f"{name:<12} {before[name][2]:>5.0f} {before[name][0]:>10.0f} {before[name][1]:>12.3f} "
+              f"{after[name][0]:>10.0f} {after[name][1]:>11.3f}")
+    old_score, new_score = initial.objective(), final.objective()
+    print(f"worst peak/bound: {old_score[0]:.2f} -> {new_score[0]:.2f}, "
+          f"sum: {old_score[1]:.2f} -> {new_score[1]:.2f}  (table -> {args.out})")
+    if args.check and not new_score < old_score:
+        print("objective not lowered")
+        raise SystemExit(1)